@@ -0,0 +1,257 @@
+# benchmarks.py
+# Headless benchmarks for the physics and rendering hot paths. Each one is
+# run at increasing particle counts (and grid sizes for the arrow grid) and
+# reports seconds per call, calls per second and the scaling exponent
+# (slope of log time against log size). No display is needed:
+#
+#     python benchmarks.py [--quick] [--only fields,motion] [--json out.json]
+#                          [--csv out.csv]
+
+import argparse
+import csv
+import json
+import math
+import random
+import time
+
+import physicslab
+from retainedcanvas import RetainedCanvas
+
+class StubCanvas(object):
+    #accepts every Tk canvas call and only counts the items it would create
+    def __init__(self):
+        self.items = 0
+
+    def __getattr__(self, name):
+        def call(*args, **options):
+            if name.startswith('create_'):
+                self.items += 1
+                return self.items
+        return call
+
+def makeScene(n, gridSize=8, sensors=0, seed=0, width=1000, height=800):
+    #n charges (half protons, half electrons) spread over the canvas
+    rng = random.Random(seed)
+    sim = physicslab.Simulation(width, height, gridSize)
+    for i in range(n):
+        x = rng.uniform(width/20, 0.9*width)
+        y = rng.uniform(height/20, 0.85*height)
+        if i % 2 == 0:
+            sim.addProton(x, y)
+        else:
+            sim.addElectron(x, y)
+    for i in range(sensors):
+        sim.addSensor(rng.uniform(0, width), rng.uniform(0, 0.85*height))
+    return sim
+
+def makeGuiData(sim):
+    class Struct(object): pass
+    data = Struct()
+    data.width, data.height = sim.width, sim.height
+    physicslab.init(data)
+    data.sim = sim
+    data.startScreenOn = False
+    return data
+
+def timeIt(fn, minTime=.2, maxCalls=1000):
+    #seconds per call, repeating until minTime has passed
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime or calls >= maxCalls:
+            return elapsed / calls
+
+##########################BENCHMARKS############################
+# each takes (n, gridSize) and returns (function to time, pair interactions
+# per call)
+
+def benchFieldsLegacy(n, gridSize):
+    sim = makeScene(n, gridSize)
+    def run():
+        for fieldList in sim.fields:
+            for field in fieldList:
+                field.point(sim.particles, sim)
+    return (run, n * gridSize**2)
+
+def benchFieldsBatched(n, gridSize):
+    sim = makeScene(n, gridSize)
+    sim.fieldExists = n > 0
+    return (sim.pointFieldsAndSensors, n * gridSize**2)
+
+def benchSensorsLegacy(n, gridSize, sensors=16):
+    sim = makeScene(n, gridSize, sensors)
+    def run():
+        for sensor in sim.sensors:
+            sensor.netF = sensor.calcNetField(sim.particles, sim)
+    return (run, n * sensors)
+
+def benchSensorsBatched(n, gridSize, sensors=16):
+    sim = makeScene(n, gridSize, sensors)
+    sim.fieldExists = False
+    return (sim.pointFieldsAndSensors, n * sensors)
+
+def benchMoveInMotion(n, gridSize):
+    #the original per-particle path: each particle sums its own forces
+    sim = makeScene(n, gridSize)
+    def run():
+        for particleList in sim.particles:
+            for particle in particleList:
+                particle.moveInMotion(sim)
+    return (run, n * (n-1))
+
+def benchMotionDirect(n, gridSize):
+    sim = makeScene(n, gridSize)
+    sim.forceEngine = 'direct'
+    steps = sim.integrator.substeps + 1
+    return (sim.stepMotion, steps * n * (n-1) // 2)
+
+def benchMotionBarnesHut(n, gridSize):
+    sim = makeScene(n, gridSize)
+    sim.forceEngine = 'barneshut'
+    sim.directBelow = 0
+    steps = sim.integrator.substeps + 1
+    return (sim.stepMotion, steps * n * (n-1) // 2)
+
+def benchPulse(n, gridSize):
+    sim = makeScene(n, gridSize)
+    sim.voltmeter.calcNetVolt(sim)
+    return (lambda: sim.voltmeter.pulse(sim), n * n * 13 * sim.width)
+
+def benchTrace(n, gridSize):
+    sim = makeScene(n, gridSize)
+    return (lambda: sim.voltmeter.trace(sim), None)
+
+def benchFieldLines(n, gridSize):
+    sim = makeScene(n, gridSize)
+    def run():
+        sim.fieldLineSignature = None
+        sim.traceFieldLines()
+    return (run, None)
+
+def benchFieldsMesh(n, gridSize):
+    sim = makeScene(n, gridSize, sensors=16)
+    sim.fieldSolver = 'mesh'
+    def run():
+        sim.mesh.signature = None
+        sim.pointFieldsAndSensors()
+    return (run, None)
+
+def benchRedraw(n, gridSize):
+    #immediate mode: every item is created again each frame
+    sim = makeScene(n, gridSize, sensors=4)
+    sim.step()
+    data = makeGuiData(sim)
+    canvas = StubCanvas()
+    return (lambda: physicslab.redrawAll(canvas, data), None)
+
+def benchRedrawRetained(n, gridSize):
+    sim = makeScene(n, gridSize, sensors=4)
+    sim.step()
+    data = makeGuiData(sim)
+    scene = RetainedCanvas(StubCanvas())
+    def run():
+        scene.beginFrame()
+        physicslab.redrawAll(scene, data)
+        scene.endFrame()
+    return (run, None)
+
+def benchStep(n, gridSize):
+    sim = makeScene(n, gridSize, sensors=4)
+    return (sim.step, None)
+
+# name: (function, particle counts, grid sizes, quick particle counts)
+BENCHMARKS = [
+    ('fields', benchFieldsLegacy, [8, 32, 128], [8, 16, 32], [8, 32]),
+    ('fieldsBatched', benchFieldsBatched, [8, 32, 128, 512], [8, 16, 32],
+     [8, 32]),
+    ('fieldsMesh', benchFieldsMesh, [128, 512, 2048], [8, 32], [8, 32]),
+    ('sensors', benchSensorsLegacy, [8, 32, 128, 512], [8], [8, 32]),
+    ('sensorsBatched', benchSensorsBatched, [8, 32, 128, 512], [8],
+     [8, 32]),
+    ('moveInMotion', benchMoveInMotion, [8, 32, 128], [8], [8, 32]),
+    ('motion', benchMotionDirect, [8, 32, 128, 256], [8], [8, 32]),
+    ('motionBarnesHut', benchMotionBarnesHut, [32, 128, 256, 512], [8],
+     [32, 128]),
+    ('pulse', benchPulse, [1, 2, 4], [8], [1, 2]),
+    ('trace', benchTrace, [2, 8, 32, 128], [8], [2, 8]),
+    ('fieldLines', benchFieldLines, [2, 8, 32], [8], [2, 8]),
+    ('redraw', benchRedraw, [8, 32, 128, 512], [8, 16], [8, 32]),
+    ('redrawRetained', benchRedrawRetained, [8, 32, 128, 512], [8, 16],
+     [8, 32]),
+    ('step', benchStep, [8, 32, 128], [8], [8, 32]),
+]
+
+def scalingExponent(results):
+    #least-squares slope of log(seconds) against log(particles)
+    points = [(math.log(r['particles']), math.log(r['seconds']))
+              for r in results if r['particles'] > 0 and r['seconds'] > 0]
+    if len(set([x for (x, y) in points])) < 2:
+        return None
+    mx = sum([x for (x, y) in points]) / len(points)
+    my = sum([y for (x, y) in points]) / len(points)
+    num = sum([(x - mx) * (y - my) for (x, y) in points])
+    den = sum([(x - mx)**2 for (x, y) in points])
+    return num / den
+
+def runBenchmarks(only=None, quick=False, minTime=.2, report=print):
+    results = []
+    for (name, bench, counts, grids, quickCounts) in BENCHMARKS:
+        if only is not None and name not in only:
+            continue
+        if quick:
+            counts, grids = quickCounts, grids[:1]
+        for gridSize in grids:
+            rows = []
+            for n in counts:
+                (fn, pairs) = bench(n, gridSize)
+                seconds = timeIt(fn, minTime)
+                row = {'benchmark': name, 'particles': n, 'grid': gridSize,
+                       'seconds': seconds, 'callsPerSecond': 1 / seconds,
+                       'pairsPerSecond': None}
+                if pairs:
+                    row['pairsPerSecond'] = pairs / seconds
+                rows.append(row)
+                report(formatRow(row))
+            exponent = scalingExponent(rows)
+            if exponent is not None:
+                report('%-16s grid %-3d scales as n^%.2f' %
+                       (name, gridSize, exponent))
+            results.extend(rows)
+    return results
+
+def formatRow(row):
+    pairs = ''
+    if row['pairsPerSecond'] is not None:
+        pairs = '%12.0f pairs/s' % row['pairsPerSecond']
+    return ('%-16s n=%-5d grid=%-3d %10.3f ms %10.1f calls/s %s' %
+            (row['benchmark'], row['particles'], row['grid'],
+             row['seconds'] * 1000, row['callsPerSecond'], pairs))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Headless benchmarks for the simulator hot paths')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes only')
+    parser.add_argument('--only', help='comma separated benchmark names')
+    parser.add_argument('--min-time', type=float, default=.2,
+                        help='seconds to repeat each measurement')
+    parser.add_argument('--json', help='write results to a JSON file')
+    parser.add_argument('--csv', help='write results to a CSV file')
+    args = parser.parse_args()
+    only = None
+    if args.only:
+        only = args.only.split(',')
+    results = runBenchmarks(only, args.quick, args.min_time)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# collisions.py
+# Contact detection for motion mode. Broad phase: circles are bucketed in a
+# uniform grid whose cells are as wide as the largest diameter, so a circle
+# can only touch circles in its own or a neighbouring cell; each pair of
+# neighbouring cells is visited once. Narrow phase: exact circle overlap.
+# Building the grid and finding the contacts is O(N) for spread-out charges.
+
+def findContacts(xs, ys, radii):
+    #(i, j) with i < j for every pair of overlapping circles
+    n = len(xs)
+    if n < 2:
+        return []
+    size = 2 * max(radii)
+    if size <= 0:
+        return []
+    cells = {}
+    for i in range(n):
+        key = (int(xs[i] // size), int(ys[i] // size))
+        bucket = cells.get(key)
+        if bucket is None:
+            cells[key] = [i]
+        else:
+            bucket.append(i)
+    contacts = []
+    for ((col, row), members) in cells.items():
+        #own cell, then the neighbours "after" it so no pair of cells is
+        #looked at twice
+        for (dc, dr) in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            if (dc, dr) == (0, 0):
+                others = members
+            else:
+                others = cells.get((col + dc, row + dr))
+                if others is None:
+                    continue
+            for a in range(len(members)):
+                i = members[a]
+                xi, yi, ri = xs[i], ys[i], radii[i]
+                start = a + 1 if others is members else 0
+                for b in range(start, len(others)):
+                    j = others[b]
+                    reach = ri + radii[j]
+                    dx, dy = xs[j] - xi, ys[j] - yi
+                    if dx*dx + dy*dy < reach*reach:
+                        contacts.append((min(i, j), max(i, j)))
+    return contacts
+
+def holdTouchingOpposites(store, oldX, oldY, stats=None):
+    #after a move: opposite charges that now overlap go back to where they
+    #were and stop, like the undo in the original Particle.moveInMotion.
+    #Resolved in one pass over the contacts.
+    x, y, charge = store.x, store.y, store.charge
+    contacts = findContacts(x, y, store.radius)
+    if stats is not None:
+        stats['contacts'] = stats.get('contacts', 0) + len(contacts)
+    held = set()
+    for (i, j) in contacts:
+        if charge[i] * charge[j] < 0:
+            held.add(i)
+            held.add(j)
+    for i in held:
+        x[i], y[i] = oldX[i], oldY[i]
+        store.vx[i], store.vy[i] = 0, 0
+    return held
@@ -0,0 +1,133 @@
+# equipotential.py
+# Traces equipotential lines by following the contour instead of sampling the
+# whole canvas: find a point at the target voltage, then repeatedly step
+# along the direction perpendicular to the gradient (predictor) and pull the
+# point back onto the contour with a Newton step along the gradient
+# (corrector). Charges are (x, y, charge) tuples in canvas pixels.
+
+import math
+import kernels
+
+K = kernels.K
+
+def potentialAndGradient(x, y, charges, meter, k=K):
+    #volts at (x, y) and its gradient in volts per pixel
+    (v, gx, gy) = kernels.potentialAndGradientAt(x, y, charges, meter, k)
+    return (v, gx / meter, gy / meter)
+
+def potential(x, y, charges, meter, k=K):
+    return kernels.potentialAt(x, y, charges, meter, k)
+
+def findSeeds(target, charges, meter, width, height, k=K, rays=12):
+    #march outward from every charge along a few rays and bisect wherever
+    #the potential crosses the target
+    seeds = []
+    for (cx, cy, q) in charges:
+        for i in range(rays):
+            ang = 2*math.pi*i/rays
+            cos, sin = math.cos(ang), math.sin(ang)
+            r0 = 1
+            v0 = potential(cx + r0*cos, cy + r0*sin, charges, meter, k)
+            while True:
+                r1 = r0 * 1.25
+                x, y = cx + r1*cos, cy + r1*sin
+                if not (0 <= x <= width and 0 <= y <= height):
+                    break
+                v1 = potential(x, y, charges, meter, k)
+                if (v0 - target) * (v1 - target) < 0:
+                    r = bisect(cx, cy, cos, sin, r0, r1, target, charges,
+                               meter, k)
+                    seeds.append((cx + r*cos, cy + r*sin))
+                r0, v0 = r1, v1
+    return seeds
+
+def bisect(cx, cy, cos, sin, lo, hi, target, charges, meter, k):
+    vLo = potential(cx + lo*cos, cy + lo*sin, charges, meter, k) - target
+    for i in range(40):
+        mid = (lo + hi) / 2
+        vMid = potential(cx + mid*cos, cy + mid*sin, charges, meter, k) - target
+        if vLo * vMid <= 0:
+            hi = mid
+        else:
+            lo, vLo = mid, vMid
+        if hi - lo < .01:
+            break
+    return (lo + hi) / 2
+
+def correct(x, y, target, charges, meter, k, iterations=3):
+    #Newton steps along the gradient back onto V = target
+    for i in range(iterations):
+        (v, gx, gy) = potentialAndGradient(x, y, charges, meter, k)
+        g2 = gx*gx + gy*gy
+        if g2 == 0:
+            return None
+        x -= (v - target) * gx / g2
+        y -= (v - target) * gy / g2
+    return (x, y)
+
+def followContour(seed, target, charges, meter, width, height, k, step,
+                  maxSteps, direction):
+    #one direction from the seed; returns (points, closed)
+    points = [seed]
+    (x, y) = seed
+    for i in range(maxSteps):
+        (v, gx, gy) = potentialAndGradient(x, y, charges, meter, k)
+        g = math.sqrt(gx*gx + gy*gy)
+        if g == 0:
+            break
+        #predictor: along the tangent (gradient rotated 90 degrees)
+        px = x - direction * step * gy / g
+        py = y + direction * step * gx / g
+        corrected = correct(px, py, target, charges, meter, k)
+        if corrected is None:
+            break
+        (x, y) = corrected
+        if not (0 <= x <= width and 0 <= y <= height):
+            break
+        if (i > 2 and
+            math.sqrt((x - seed[0])**2 + (y - seed[1])**2) < step):
+            points.append(seed)
+            return (points, True)
+        points.append((x, y))
+    return (points, False)
+
+def traceContour(seed, target, charges, meter, width, height, k=K, step=4,
+                 maxSteps=2000):
+    #ordered polyline through seed; closed loops end where they started
+    seed = correct(seed[0], seed[1], target, charges, meter, k)
+    if seed is None:
+        return []
+    (forward, closed) = followContour(seed, target, charges, meter, width,
+                                      height, k, step, maxSteps, 1)
+    if closed:
+        return forward
+    (backward, closed) = followContour(seed, target, charges, meter, width,
+                                       height, k, step, maxSteps, -1)
+    return list(reversed(backward)) + forward[1:]
+
+def traceEquipotentials(target, charges, meter, width, height, seeds=(),
+                        k=K, step=4, maxSteps=2000):
+    #every contour at the target voltage that the given seeds or the rays
+    #around the charges hit, each as an ordered list of (x, y)
+    if len(charges) == 0:
+        return []
+    lines = []
+    visited = set()
+    for seed in list(seeds) + findSeeds(target, charges, meter, width,
+                                        height, k):
+        if cellOf(seed, step) in visited:
+            continue
+        line = traceContour(seed, target, charges, meter, width, height, k,
+                            step, maxSteps)
+        if len(line) < 2:
+            continue
+        for point in line:
+            (col, row) = cellOf(point, step)
+            for dc in (-1, 0, 1):
+                for dr in (-1, 0, 1):
+                    visited.add((col + dc, row + dr))
+        lines.append(line)
+    return lines
+
+def cellOf(point, step):
+    return (int(point[0] // (2*step)), int(point[1] // (2*step)))
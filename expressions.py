@@ -0,0 +1,160 @@
+# expressions.py
+# Vector field functions typed in function mode, e.g. "y*cos(x)" or "-x/r".
+# Text is parsed once into a Python code object after checking that it only
+# uses numbers, x, y, r, pi, e, arithmetic and the functions in FUNCTIONS,
+# so nothing else can be reached from it. The compiled function is evaluated
+# for a whole set of points at once: one NumPy pass when NumPy is installed,
+# otherwise a plain loop with math.
+
+import ast
+import functools
+import io
+import math
+import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_LENGTH = 200
+
+FUNCTIONS = ['sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'sinh', 'cosh',
+             'tanh', 'exp', 'log', 'sqrt', 'abs', 'atan2', 'hypot', 'floor',
+             'ceil', 'min', 'max']
+CONSTANTS = {'pi': math.pi, 'e': math.e}
+VARIABLES = ['x', 'y', 'r']
+
+OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod,
+             ast.FloorDiv, ast.UAdd, ast.USub)
+
+def mathNamespace():
+    #every value is a float (see FloatConstants), so each function must
+    #return one too; math.floor and math.ceil alone return ints
+    names = {'abs': abs, 'min': min, 'max': max,
+             'floor': lambda value: float(math.floor(value)),
+             'ceil': lambda value: float(math.ceil(value))}
+    for name in FUNCTIONS:
+        if name not in names:
+            names[name] = getattr(math, name)
+    names.update(CONSTANTS)
+    return names
+
+def numpyNamespace():
+    #np.minimum/np.maximum take two arrays (a third would be `out`), so
+    #min and max fold over all their arguments
+    names = {'abs': np.abs,
+             'min': lambda *values: functools.reduce(np.minimum, values),
+             'max': lambda *values: functools.reduce(np.maximum, values),
+             'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+             'atan2': np.arctan2}
+    for name in FUNCTIONS:
+        if name not in names:
+            names[name] = getattr(np, name)
+    names.update(CONSTANTS)
+    return names
+
+def powers(text):
+    #"^" is read as a power, as typed. It is swapped for "**" before
+    #parsing so it also binds like one: x^2-y is x**2 - y, not x**(2-y)
+    tokens = []
+    for token in tokenize.generate_tokens(io.StringIO(text).readline):
+        if token.type == tokenize.OP and token.string == '^':
+            tokens.append((tokenize.OP, '**'))
+        else:
+            tokens.append((token.type, token.string))
+    return tokenize.untokenize(tokens)
+
+class FloatConstants(ast.NodeTransformer):
+    #integer powers like 9**9**9 would be computed exactly (and forever);
+    #floats overflow at once instead
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+def check(tree):
+    #ValueError naming the first thing that is not allowed
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Load, ast.BinOp,
+                             ast.UnaryOp) + OPERATORS):
+            continue
+        if isinstance(node, ast.Constant):
+            if (isinstance(node.value, bool) or
+                not isinstance(node.value, (int, float))):
+                raise ValueError('only numbers are allowed: %r' % node.value)
+        elif isinstance(node, ast.Name):
+            if (node.id not in VARIABLES and node.id not in CONSTANTS and
+                node.id not in FUNCTIONS):
+                raise ValueError('unknown name: %s' % node.id)
+        elif isinstance(node, ast.Call):
+            if (not isinstance(node.func, ast.Name) or
+                node.func.id not in FUNCTIONS or len(node.keywords) > 0):
+                raise ValueError('unknown function call')
+        else:
+            raise ValueError('not allowed: %s' % type(node).__name__)
+
+def compileExpression(text):
+    #code object for text; ValueError if it is empty, too long, does not
+    #parse or uses anything outside the allowed names and operators
+    text = text.strip()
+    if len(text) == 0 or len(text) > MAX_LENGTH:
+        raise ValueError('expression must be 1 to %d characters' % MAX_LENGTH)
+    try:
+        tree = ast.parse(powers(text).strip(), mode='eval')
+    except (SyntaxError, tokenize.TokenError):
+        raise ValueError('cannot parse: %s' % text)
+    check(tree)
+    tree = FloatConstants().visit(tree)
+    ast.fix_missing_locations(tree)
+    return compile(tree, '<function mode>', 'eval')
+
+class VectorFunction(object):
+    #(fx, fy) = (xText, yText) evaluated at many (x, y) points at once
+    def __init__(self, xText, yText):
+        self.xText = xText
+        self.yText = yText
+        self.xCode = compileExpression(xText)
+        self.yCode = compileExpression(yText)
+
+    def evaluate(self, xs, ys, useNumpy=None):
+        #list of (fx, fy); points where a value is undefined (log(-1),
+        #1/0, overflow) get a zero vector
+        if useNumpy is None:
+            useNumpy = np is not None
+        if useNumpy and len(xs) > 0:
+            return self.numpyEvaluate(xs, ys)
+        return self.pythonEvaluate(xs, ys)
+
+    def pythonEvaluate(self, xs, ys):
+        names = mathNamespace()
+        vectors = []
+        for i in range(len(xs)):
+            names['x'], names['y'] = xs[i], ys[i]
+            names['r'] = math.sqrt(xs[i]**2 + ys[i]**2)
+            try:
+                fx = float(eval(self.xCode, {'__builtins__': {}}, names))
+                fy = float(eval(self.yCode, {'__builtins__': {}}, names))
+            except (ArithmeticError, ValueError, TypeError):
+                fx = fy = 0
+            if not (math.isfinite(fx) and math.isfinite(fy)):
+                fx = fy = 0
+            vectors.append((fx, fy))
+        return vectors
+
+    def numpyEvaluate(self, xs, ys):
+        names = numpyNamespace()
+        x = np.asarray(xs, dtype=float)
+        y = np.asarray(ys, dtype=float)
+        names['x'], names['y'], names['r'] = x, y, np.hypot(x, y)
+        with np.errstate(all='ignore'):
+            try:
+                fx = np.broadcast_to(eval(self.xCode, {'__builtins__': {}},
+                                          names), x.shape).astype(float)
+                fy = np.broadcast_to(eval(self.yCode, {'__builtins__': {}},
+                                          names), x.shape).astype(float)
+            except (ArithmeticError, ValueError, TypeError):
+                #something numpy cannot do elementwise; go point by point
+                return self.pythonEvaluate(list(x), list(y))
+        bad = ~(np.isfinite(fx) & np.isfinite(fy))
+        fx[bad] = 0
+        fy[bad] = 0
+        return list(zip(fx.tolist(), fy.tolist()))
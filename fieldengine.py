@@ -0,0 +1,75 @@
+# fieldengine.py
+# Batched electric field evaluation: every probe point against every charge
+# in one go instead of one Field.calcNetField call per arrow.
+# NumPy is used when it is installed; otherwise it falls back to plain Python
+# so the simulator still runs with nothing extra installed.
+
+import kernels
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+K = kernels.K
+MIN_R = kernels.MIN_R
+#rough cap on points*charges per numpy chunk to bound temporary arrays
+CHUNK = 2**20
+
+def hasNumpy():
+    return np is not None
+
+def chargesOf(particles):
+    #flatten [protons, electrons] into (x, y, charge) tuples
+    charges = []
+    for particleList in particles:
+        for particle in particleList:
+            charges.append((particle.x, particle.y, particle.charge))
+    return charges
+
+def calcFieldVectors(points, charges, meter, k=K, useNumpy=True):
+    #returns [(ex, ey), ...] in V/m for each (x, y) point.
+    #ey points up the screen, matching the angles Field uses.
+    if len(points) == 0:
+        return []
+    if len(charges) == 0:
+        return [(0, 0)] * len(points)
+    if useNumpy and np is not None:
+        return numpyFieldVectors(points, charges, meter, k)
+    return pythonFieldVectors(points, charges, meter, k)
+
+def calcNetFields(points, charges, meter, k=K, useNumpy=True):
+    #same as calcFieldVectors but in the [magnitude, angle] form of netVector
+    netFields = []
+    for (ex, ey) in calcFieldVectors(points, charges, meter, k, useNumpy):
+        netFields.append(kernels.polar(ex, ey))
+    return netFields
+
+def pythonFieldVectors(points, charges, meter, k):
+    return [kernels.fieldAt(x, y, charges, meter, k) for (x, y) in points]
+
+def numpyFieldVectors(points, charges, meter, k):
+    pts = np.asarray(points, dtype=float)
+    chg = np.asarray(charges, dtype=float)
+    cx, cy, kq = chg[:, 0], chg[:, 1], k * chg[:, 2]
+    ex = np.empty(len(pts))
+    ey = np.empty(len(pts))
+    step = max(1, CHUNK // len(chg))
+    for start in range(0, len(pts), step):
+        px = pts[start:start+step, 0:1]
+        py = pts[start:start+step, 1:2]
+        dx = (px - cx) / meter
+        dy = (cy - py) / meter
+        r2 = dx*dx + dy*dy
+        zero = (r2 == 0)
+        r2[zero] = 1
+        scale = kq / (r2 * np.sqrt(r2))
+        fx = scale * dx
+        fy = scale * dy
+        if zero.any():
+            #coincident point: along +x, like kernels.fieldAt
+            fx = np.where(zero, kq / MIN_R**2, fx)
+            fy[zero] = 0
+        ex[start:start+step] = fx.sum(axis=1)
+        ey[start:start+step] = fy.sum(axis=1)
+    return list(zip(ex.tolist(), ey.tolist()))
@@ -0,0 +1,98 @@
+# fieldgrid.py
+# Adaptive (quadtree) layout for the field arrows. Cells are split where the
+# field changes a lot across them and left coarse where it is smooth, so only
+# the leaf cells get an arrow and a field evaluation.
+
+import math
+
+class QuadCell(object):
+    def __init__(self, x, y, width, height, depth):
+        #x, y is the center of the cell
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.vector = (0, 0)
+
+    def corners(self):
+        #rounded so neighbouring cells produce identical shared corners
+        w, h = self.width/2, self.height/2
+        return [snap((self.x-w, self.y-h)), snap((self.x+w, self.y-h)),
+                snap((self.x-w, self.y+h)), snap((self.x+w, self.y+h))]
+
+    def center(self):
+        return snap((self.x, self.y))
+
+    def split(self):
+        w, h = self.width/2, self.height/2
+        children = []
+        for (x, y) in [(self.x-w/2, self.y-h/2), (self.x+w/2, self.y-h/2),
+                       (self.x-w/2, self.y+h/2), (self.x+w/2, self.y+h/2)]:
+            children.append(QuadCell(x, y, w, h, self.depth+1))
+        return children
+
+class AdaptiveGrid(object):
+    def __init__(self, left, top, right, bottom, baseCells=4, maxDepth=3,
+                 tolerance=.75):
+        self.left, self.top = left, top
+        self.right, self.bottom = right, bottom
+        self.baseCells = baseCells
+        self.maxDepth = maxDepth
+        #relative change of E across a cell above which it gets split
+        self.tolerance = tolerance
+        self.leaves = []
+
+    def rootCells(self):
+        width = (self.right - self.left) / self.baseCells
+        height = (self.bottom - self.top) / self.baseCells
+        cells = []
+        for row in range(self.baseCells):
+            for col in range(self.baseCells):
+                cells.append(QuadCell(self.left + (col+.5)*width,
+                                      self.top + (row+.5)*height,
+                                      width, height, 0))
+        return cells
+
+    def refine(self, evaluate):
+        #evaluate(points) -> [(ex, ey), ...] for a list of (x, y) points.
+        #Each level is sampled in one call; shared corners are reused.
+        samples = {}
+        leaves = []
+        level = self.rootCells()
+        while len(level) > 0:
+            needed = []
+            for cell in level:
+                for point in [cell.center()] + cell.corners():
+                    if point not in samples:
+                        samples[point] = None
+                        needed.append(point)
+            for point, vector in zip(needed, evaluate(needed)):
+                samples[point] = vector
+
+            nextLevel = []
+            for cell in level:
+                cell.vector = samples[cell.center()]
+                cornerVectors = [samples[point] for point in cell.corners()]
+                if (cell.depth < self.maxDepth and
+                    variation(cell.vector, cornerVectors) > self.tolerance):
+                    nextLevel.extend(cell.split())
+                else:
+                    leaves.append(cell)
+            level = nextLevel
+        self.leaves = leaves
+        return leaves
+
+def snap(point):
+    return (round(point[0], 6), round(point[1], 6))
+
+def variation(center, others):
+    #largest change from the center vector, relative to the largest magnitude
+    largest = math.hypot(center[0], center[1])
+    change = 0
+    for (ex, ey) in others:
+        largest = max(largest, math.hypot(ex, ey))
+        change = max(change, math.hypot(ex - center[0], ey - center[1]))
+    if largest == 0:
+        return 0
+    return change / largest
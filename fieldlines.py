@@ -0,0 +1,103 @@
+# fieldlines.py
+# Electric field lines. Lines start on a small circle around every positive
+# charge (more lines for bigger charges) and follow the field direction with
+# classic RK4 until they reach a negative charge, leave the canvas or run out
+# of steps. All lines are advanced together so every RK4 stage is one batched
+# fieldengine call. The step grows with the distance to the nearest charge:
+# small where the field bends sharply, large in open space.
+# Charges are (x, y, charge) tuples in canvas pixels; lines are lists of
+# (x, y) points.
+
+import math
+
+import fieldengine
+
+K = fieldengine.K
+
+def seeds(charges, linesPerNanoCoulomb=8, radius=22):
+    #(x, y, source index) evenly around each positive charge
+    points = []
+    for i in range(len(charges)):
+        (cx, cy, q) = charges[i]
+        if q <= 0:
+            continue
+        count = max(1, int(round(linesPerNanoCoulomb * q / 10**-9)))
+        for j in range(count):
+            angle = 2*math.pi * (j + .5) / count
+            points.append((cx + radius*math.cos(angle),
+                           cy + radius*math.sin(angle), i))
+    return points
+
+def directions(points, charges, meter, k):
+    #unit vectors along the field, in canvas directions (y down)
+    units = []
+    for (ex, ey) in fieldengine.calcFieldVectors(points, charges, meter, k):
+        mag = math.sqrt(ex**2 + ey**2)
+        if mag == 0:
+            units.append((0, 0))
+        else:
+            units.append((ex/mag, -ey/mag))
+    return units
+
+def nearestCharge(x, y, charges):
+    #(index, distance) of the closest charge
+    best, bestDist = None, None
+    for i in range(len(charges)):
+        (cx, cy, q) = charges[i]
+        dist = math.sqrt((x - cx)**2 + (y - cy)**2)
+        if bestDist is None or dist < bestDist:
+            best, bestDist = i, dist
+    return (best, bestDist)
+
+def traceFieldLines(charges, meter, width, height, k=K,
+                    linesPerNanoCoulomb=8, captureRadius=20, minStep=2,
+                    maxStep=20, maxSteps=400):
+    starts = seeds(charges, linesPerNanoCoulomb, captureRadius + 2)
+    lines = [[(x, y)] for (x, y, source) in starts]
+    sources = [source for (x, y, source) in starts]
+    travelled = [0] * len(lines)
+    #distance from each head to its nearest charge, kept from the step
+    #that produced the head
+    gaps = [captureRadius + 2] * len(lines)
+    active = list(range(len(lines)))
+    steps = 0
+    while len(active) > 0 and steps < maxSteps:
+        steps += 1
+        heads = [lines[i][-1] for i in active]
+        sizes = [min(maxStep, max(minStep, gaps[i]/4)) for i in active]
+        #RK4, one batched field evaluation per stage
+        k1 = directions(heads, charges, meter, k)
+        k2 = directions([(heads[j][0] + sizes[j]/2*k1[j][0],
+                          heads[j][1] + sizes[j]/2*k1[j][1])
+                         for j in range(len(heads))], charges, meter, k)
+        k3 = directions([(heads[j][0] + sizes[j]/2*k2[j][0],
+                          heads[j][1] + sizes[j]/2*k2[j][1])
+                         for j in range(len(heads))], charges, meter, k)
+        k4 = directions([(heads[j][0] + sizes[j]*k3[j][0],
+                          heads[j][1] + sizes[j]*k3[j][1])
+                         for j in range(len(heads))], charges, meter, k)
+        stillActive = []
+        for j in range(len(active)):
+            i, h = active[j], sizes[j]
+            if k1[j] == (0, 0):
+                continue
+            x = heads[j][0] + h/6 * (k1[j][0] + 2*k2[j][0] +
+                                     2*k3[j][0] + k4[j][0])
+            y = heads[j][1] + h/6 * (k1[j][1] + 2*k2[j][1] +
+                                     2*k3[j][1] + k4[j][1])
+            travelled[i] += h
+            if not (0 <= x <= width and 0 <= y <= height):
+                continue
+            (index, dist) = nearestCharge(x, y, charges)
+            if dist <= captureRadius:
+                (cx, cy, q) = charges[index]
+                if q < 0 or (index != sources[i] or
+                             travelled[i] > 4*captureRadius):
+                    #ends on a sink (or runs back into a source)
+                    lines[i].append((cx, cy))
+                    continue
+            lines[i].append((x, y))
+            gaps[i] = dist
+            stillActive.append(i)
+        active = stillActive
+    return [line for line in lines if len(line) > 1]
@@ -0,0 +1,169 @@
+# forces.py
+# Net Coulomb force on every particle at once, for motion mode.
+# Bodies are (x, y, charge) tuples in canvas pixels; forces come back as
+# (fx, fy) in newtons in canvas directions, the same convention as
+# kernels.pairForce (positive charge product pushes the bodies apart).
+
+import math
+import kernels
+
+K = kernels.K
+MIN_R = kernels.MIN_R
+
+def calcForces(bodies, meter, k=K, engine='direct', theta=.5,
+               directBelow=1000, stats=None):
+    #engine is 'direct' or 'barneshut'; small systems always use the direct
+    #sum since building the tree costs more than it saves.
+    #stats, if given, is a dict whose 'forcePairs' gets the interaction count
+    if engine == 'barneshut' and len(bodies) >= directBelow:
+        return barnesHutForces(bodies, meter, k, theta, stats)
+    return directForces(bodies, meter, k, stats)
+
+def tally(stats, pairs):
+    if stats is not None:
+        stats['forcePairs'] = stats.get('forcePairs', 0) + pairs
+
+def directForces(bodies, meter, k=K, stats=None):
+    #each pair is evaluated once and applied to both bodies with opposite
+    #signs (Newton's third law), so this is n(n-1)/2 pair evaluations
+    n = len(bodies)
+    fx = [0] * n
+    fy = [0] * n
+    for i in range(n):
+        (x, y, q) = bodies[i]
+        for j in range(i+1, n):
+            (ox, oy, oq) = bodies[j]
+            (px, py) = kernels.pairForce(x, y, q, ox, oy, oq, meter, k)
+            fx[i] += px
+            fy[i] += py
+            fx[j] -= px
+            fy[j] -= py
+    tally(stats, n*(n-1)//2)
+    return list(zip(fx, fy))
+
+##########################BARNES_HUT############################
+class QuadNode(object):
+    #square node; positive and negative charge are summarized separately
+    #because a mixed node's net charge can cancel while its field does not
+    leafSize = 8
+    maxDepth = 32
+
+    def __init__(self, cx, cy, half, depth=0):
+        self.cx = cx
+        self.cy = cy
+        self.half = half
+        self.depth = depth
+        self.indices = []
+        self.children = None
+        self.qPos, self.xPos, self.yPos = 0, 0, 0
+        self.qNeg, self.xNeg, self.yNeg = 0, 0, 0
+
+    def insert(self, i, bodies):
+        if self.children is not None:
+            self.childFor(bodies[i]).insert(i, bodies)
+            return
+        self.indices.append(i)
+        if len(self.indices) > self.leafSize and self.depth < self.maxDepth:
+            half = self.half/2
+            self.children = []
+            for (sx, sy) in [(-1, -1), (1, -1), (-1, 1), (1, 1)]:
+                self.children.append(QuadNode(self.cx + sx*half,
+                                              self.cy + sy*half, half,
+                                              self.depth + 1))
+            for j in self.indices:
+                self.childFor(bodies[j]).insert(j, bodies)
+            self.indices = []
+
+    def childFor(self, body):
+        index = 0
+        if body[0] >= self.cx:
+            index += 1
+        if body[1] >= self.cy:
+            index += 2
+        return self.children[index]
+
+    def summarize(self, bodies):
+        #charge-weighted centers of the positive and negative charge
+        if self.children is None:
+            members = [bodies[i] for i in self.indices]
+        else:
+            members = []
+            for child in self.children:
+                child.summarize(bodies)
+                if child.qPos != 0:
+                    members.append((child.xPos, child.yPos, child.qPos))
+                if child.qNeg != 0:
+                    members.append((child.xNeg, child.yNeg, child.qNeg))
+        for (x, y, q) in members:
+            if q > 0:
+                self.qPos += q
+                self.xPos += q * x
+                self.yPos += q * y
+            else:
+                self.qNeg += q
+                self.xNeg += q * x
+                self.yNeg += q * y
+        if self.qPos != 0:
+            self.xPos /= self.qPos
+            self.yPos /= self.qPos
+        if self.qNeg != 0:
+            self.xNeg /= self.qNeg
+            self.yNeg /= self.qNeg
+
+def buildTree(bodies):
+    xs = [body[0] for body in bodies]
+    ys = [body[1] for body in bodies]
+    cx = (max(xs) + min(xs)) / 2
+    cy = (max(ys) + min(ys)) / 2
+    half = max(max(xs) - min(xs), max(ys) - min(ys)) / 2 + 1
+    root = QuadNode(cx, cy, half)
+    for i in range(len(bodies)):
+        root.insert(i, bodies)
+    root.summarize(bodies)
+    return root
+
+def barnesHutForces(bodies, meter, k=K, theta=.5, stats=None):
+    #theta is the opening angle: a node of width s at distance d is treated
+    #as two point charges when s/d < theta. theta=0 is the exact direct sum.
+    if len(bodies) == 0:
+        return []
+    root = buildTree(bodies)
+    forces = []
+    pairs = 0
+    for i in range(len(bodies)):
+        (x, y, q) = bodies[i]
+        fx, fy = 0, 0
+        stack = [root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.children is None:
+                for j in node.indices:
+                    if j != i:
+                        pairs += 1
+                        (ox, oy, oq) = bodies[j]
+                        (px, py) = kernels.pairForce(x, y, q, ox, oy, oq,
+                                                     meter, k)
+                        fx += px
+                        fy += py
+                continue
+            if isFarEnough(node, x, y, theta):
+                pairs += 2
+                for (ox, oy, oq) in [(node.xPos, node.yPos, node.qPos),
+                                     (node.xNeg, node.yNeg, node.qNeg)]:
+                    if oq != 0:
+                        (px, py) = kernels.pairForce(x, y, q, ox, oy, oq,
+                                                     meter, k)
+                        fx += px
+                        fy += py
+            else:
+                stack.extend(node.children)
+        forces.append((fx, fy))
+    tally(stats, pairs)
+    return forces
+
+def isFarEnough(node, x, y, theta):
+    #the body itself must be outside the node for a multipole to make sense
+    if abs(x - node.cx) <= node.half and abs(y - node.cy) <= node.half:
+        return False
+    d = math.sqrt((x - node.cx)**2 + (y - node.cy)**2)
+    return 2*node.half < theta * d
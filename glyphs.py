@@ -0,0 +1,61 @@
+# glyphs.py
+# Field arrows from a lookup table instead of rotating every arrow's
+# vertices each tick. A table holds the 7-point arrow outline, relative to
+# its centre, for ANGLES directions and for each strength level; an arrow is
+# drawn by translating one entry to its grid point. Angles are snapped to
+# the nearest 360/ANGLES degrees, and since every frame starts from the
+# table there is no rounding drift however long the arrows keep turning.
+# Stronger fields get longer, brighter arrows.
+
+import math
+
+ANGLES = 72
+#field strength (V/m) at which each level starts; a level is 4 times the
+#one below, and the first covers everything weaker than LEVELS[0]
+LEVELS = [.5, 2, 8, 32]
+#shaft length and colour per level, weakest first
+LENGTHS = [.4, .55, .7, .85, 1]
+FILLS = ['gray35', 'gray55', 'gray75', 'gray90', 'white']
+
+def level(magnitude):
+    for i in range(len(LEVELS)):
+        if magnitude < LEVELS[i]:
+            return i
+    return len(LEVELS)
+
+def angleIndex(angle):
+    return int(round(angle * ANGLES / (2*math.pi))) % ANGLES
+
+def outline(width, height, arrowW):
+    #pointing along +x, centred on the shaft
+    return [(-width, -height), (width, -height), (width, -2*height),
+            (width + arrowW, 0), (width, 2*height), (width, height),
+            (-width, height)]
+
+def turned(points, angle):
+    #counterclockwise on screen (the canvas y axis points down)
+    cos, sin = math.cos(angle), math.sin(angle)
+    return [(cos*x + sin*y, -sin*x + cos*y) for (x, y) in points]
+
+class ArrowTable(object):
+    def __init__(self, width=12.5, height=5, arrowW=10):
+        #shapes[level][angleIndex] is a list of (dx, dy) offsets
+        self.shapes = []
+        for length in LENGTHS:
+            base = outline(width * length, height, arrowW)
+            self.shapes.append([turned(base, 2*math.pi * i / ANGLES)
+                                for i in range(ANGLES)])
+
+    def shape(self, magnitude, angle):
+        #(offsets, fill) for a field of this strength and direction
+        strength = level(magnitude)
+        return (self.shapes[strength][angleIndex(angle)], FILLS[strength])
+
+tables = {}
+
+def arrowTable(scale=1):
+    #one table per arrow size; a grid only ever uses a few sizes
+    table = tables.get(scale)
+    if table is None:
+        table = tables[scale] = ArrowTable(12.5*scale, 5*scale, 10*scale)
+    return table
@@ -0,0 +1,77 @@
+# integrator.py
+# Fixed-timestep velocity Verlet for motion mode. Each particle carries a 2D
+# velocity (vx, vy) in m/s, kept in data.store; positions stay in canvas
+# pixels and are converted with data.meter. A frame is always `substeps`
+# steps of `dt` seconds, so the result depends only on how many frames ran,
+# not on how fast Tk ticks.
+
+import math
+import collisions
+import forces
+import particlestore
+
+class VerletIntegrator(object):
+    def __init__(self, dt=10**-11, substeps=4):
+        self.dt = dt #seconds of physical time per substep
+        self.substeps = substeps
+
+    def frameTime(self):
+        return self.dt * self.substeps
+
+    def step(self, data):
+        #one frame
+        self.run(data, self.substeps)
+
+    def advance(self, data, seconds):
+        #fast-forward by (at least) the given physical time
+        self.run(data, self.stepsFor(seconds))
+
+    def stepsFor(self, seconds):
+        #seconds / dt is rounded first, so an exact multiple of dt that
+        #divides to 20.000000000000004 is 20 steps, not 21
+        steps = seconds / self.dt
+        nearest = round(steps)
+        if abs(steps - nearest) <= 1e-9 * max(1, nearest):
+            return int(nearest)
+        return int(math.ceil(steps))
+
+    def run(self, data, steps):
+        #works straight on the columns of data.store; clicked (dragged)
+        #particles still push the others but do not move
+        store = data.store
+        if len(store) < 2:
+            return
+        acc = self.calcAccelerations(store, data)
+        for i in range(steps):
+            acc = self.substep(store, acc, data)
+            data.time += self.dt
+
+    def calcAccelerations(self, store, data):
+        netForces = forces.calcForces(store.charges(), data.meter,
+                                      store.views[0].k, data.forceEngine,
+                                      data.theta, data.directBelow,
+                                      data.profiler.counts())
+        return [(fx / mass, fy / mass)
+                for ((fx, fy), mass) in zip(netForces, store.mass)]
+
+    def substep(self, store, acc, data):
+        #kick, drift, new forces, kick
+        dt, meter = self.dt, data.meter
+        x, y, vx, vy, flags = store.x, store.y, store.vx, store.vy, store.flags
+        oldX, oldY = x[:], y[:]
+        for i in range(len(store)):
+            if flags[i] & particlestore.CLICKED:
+                vx[i], vy[i] = 0, 0
+                continue
+            vx[i] += acc[i][0] * dt/2
+            vy[i] += acc[i][1] * dt/2
+            x[i] += vx[i] * dt * meter
+            y[i] += vy[i] * dt * meter
+        collisions.holdTouchingOpposites(store, oldX, oldY,
+                                         data.profiler.counts())
+        acc = self.calcAccelerations(store, data)
+        for i in range(len(store)):
+            if not flags[i] & particlestore.CLICKED:
+                vx[i] += acc[i][0] * dt/2
+                vy[i] += acc[i][1] * dt/2
+        return acc
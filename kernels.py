@@ -0,0 +1,88 @@
+# kernels.py
+# Coulomb force, field and potential in Cartesian components. Charges are
+# (x, y, charge) tuples in canvas pixels. Each pair costs a square root and
+# a few multiplies (dx, dy scaled by 1/r^3, or 1/r for the potential); no
+# angle is made per pair. polar() turns a summed vector into the
+# [magnitude, angle] the display uses, once per probe.
+# Particle, Field, Sensor and Voltmeter go through these, and so do the
+# plain Python paths of the batch engines.
+
+import math
+
+K = 8.9876*10**9
+#stand-in distance (meters) for a probe sitting exactly on a charge; the
+#vector then points along +x
+MIN_R = .01
+
+def polar(vx, vy):
+    return [math.sqrt(vx*vx + vy*vy), math.atan2(vy, vx)]
+
+def pairForce(x, y, q, ox, oy, oq, meter, k=K):
+    #force (N) on (x, y, q) from (ox, oy, oq), in canvas directions
+    dx = (x - ox) / meter
+    dy = (y - oy) / meter
+    r2 = dx*dx + dy*dy
+    if r2 == 0:
+        return (k * q * oq / MIN_R**2, 0)
+    scale = k * q * oq / (r2 * math.sqrt(r2))
+    return (scale * dx, scale * dy)
+
+def forceAt(x, y, q, charges, meter, k=K):
+    #net force (N) on a charge q at (x, y), canvas directions; charges must
+    #not include the charge itself
+    fx, fy = 0, 0
+    kq = k * q
+    for (cx, cy, oq) in charges:
+        dx = (x - cx) / meter
+        dy = (y - cy) / meter
+        r2 = dx*dx + dy*dy
+        if r2 == 0:
+            fx += kq * oq / MIN_R**2
+            continue
+        scale = kq * oq / (r2 * math.sqrt(r2))
+        fx += scale * dx
+        fy += scale * dy
+    return (fx, fy)
+
+def fieldAt(x, y, charges, meter, k=K):
+    #net field (V/m) at (x, y); ey points up the screen
+    ex, ey = 0, 0
+    for (cx, cy, q) in charges:
+        dx = (x - cx) / meter
+        dy = (cy - y) / meter
+        r2 = dx*dx + dy*dy
+        if r2 == 0:
+            ex += k * q / MIN_R**2
+            continue
+        scale = k * q / (r2 * math.sqrt(r2))
+        ex += scale * dx
+        ey += scale * dy
+    return (ex, ey)
+
+def potentialAndGradientAt(x, y, charges, meter, k=K):
+    #(volts, dV/dx, dV/dy) at (x, y), the gradient in V/m along the canvas
+    #axes; a charge exactly at the point adds nothing, as in potentialAt
+    v, gx, gy = 0, 0, 0
+    for (cx, cy, q) in charges:
+        dx = (x - cx) / meter
+        dy = (y - cy) / meter
+        r2 = dx*dx + dy*dy
+        if r2 == 0:
+            continue
+        r = math.sqrt(r2)
+        kq = k * q
+        v += kq / r
+        gx -= kq * dx / (r2 * r)
+        gy -= kq * dy / (r2 * r)
+    return (v, gx, gy)
+
+def potentialAt(x, y, charges, meter, k=K):
+    #volts at (x, y); a charge exactly at the point adds nothing
+    v = 0
+    for (cx, cy, q) in charges:
+        dx = (x - cx) / meter
+        dy = (y - cy) / meter
+        r2 = dx*dx + dy*dy
+        if r2 != 0:
+            v += k * q / math.sqrt(r2)
+    return v
@@ -0,0 +1,211 @@
+# meshsolver.py
+# Particle-mesh field solver. Charges are spread onto the corners of their
+# mesh cell (cloud-in-cell), the potential on the mesh is the convolution of
+# that charge grid with the Coulomb kernel k/r, done with FFTs on a
+# zero-padded grid (twice the size, so there are no periodic images), and
+# E = -grad V comes from central differences. One solve costs O(G log G) for
+# G mesh nodes whatever the number of charges; every probe after that is a
+# bilinear lookup. Within a cell or two of a charge the mesh smooths the
+# field out, so this is for scenes with many charges.
+# Uses numpy.fft when NumPy is installed; the plain Python FFT fallback
+# gives the same answer but is slow.
+
+import cmath
+import math
+import kernels
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+K = kernels.K
+
+def hasNumpy():
+    return np is not None
+
+def paddedSize(n):
+    size = 1
+    while size < 2*n:
+        size *= 2
+    return size
+
+def fft(values, inverse=False):
+    #iterative radix-2 FFT of a list of complex numbers (length a power of
+    #two); the inverse is not divided by the length
+    n = len(values)
+    values = list(values)
+    j = 0
+    for i in range(1, n):
+        bit = n >> 1
+        while j & bit:
+            j ^= bit
+            bit >>= 1
+        j |= bit
+        if i < j:
+            values[i], values[j] = values[j], values[i]
+    sign = 1 if inverse else -1
+    length = 2
+    while length <= n:
+        root = cmath.exp(sign * 2j * math.pi / length)
+        half = length // 2
+        for start in range(0, n, length):
+            w = 1
+            for i in range(start, start + half):
+                a, b = values[i], values[i + half] * w
+                values[i], values[i + half] = a + b, a - b
+                w *= root
+        length *= 2
+    return values
+
+def fft2(grid, inverse=False):
+    rows = [fft(row, inverse) for row in grid]
+    columns = [fft(column, inverse) for column in zip(*rows)]
+    return [list(row) for row in zip(*columns)]
+
+class ParticleMesh(object):
+    def __init__(self, width, height, meter, cellSize=8, k=K):
+        self.width = width
+        self.height = height
+        self.meter = meter
+        self.cellSize = cellSize
+        self.k = k
+        self.cols = int(math.ceil(width / cellSize)) + 1
+        self.rows = int(math.ceil(height / cellSize)) + 1
+        self.padCols = paddedSize(self.cols)
+        self.padRows = paddedSize(self.rows)
+        self.kernel = None #transformed Coulomb kernel, made on first solve
+        self.signature = None
+        #potential (V) and field (V/m, ey up) at every node, row-major
+        self.potential = self.ex = self.ey = None
+        self.usedNumpy = None
+
+    def update(self, charges, useNumpy=True):
+        #solve again only if the charges changed; returns True if it did
+        useNumpy = useNumpy and np is not None
+        signature = tuple(charges)
+        if (signature == self.signature and self.potential is not None and
+            useNumpy == self.usedNumpy):
+            return False
+        self.signature = signature
+        if self.usedNumpy != useNumpy:
+            self.kernel = None
+        self.usedNumpy = useNumpy
+        if useNumpy:
+            self.numpySolve(charges)
+        else:
+            self.pythonSolve(charges)
+        return True
+
+    def kernelValues(self):
+        #k/r on the padded grid with wrapped distances; the node itself
+        #gets nothing, like a probe sitting on a charge
+        h = self.cellSize / self.meter
+        values = []
+        for row in range(self.padRows):
+            dy = min(row, self.padRows - row)
+            line = []
+            for col in range(self.padCols):
+                dx = min(col, self.padCols - col)
+                if dx == 0 and dy == 0:
+                    line.append(0.0)
+                else:
+                    line.append(self.k / (h * math.sqrt(dx*dx + dy*dy)))
+            values.append(line)
+        return values
+
+    def deposit(self, charges):
+        #cloud-in-cell weights: [(row, col, charge share)]; charges off the
+        #mesh are held at its edge
+        shares = []
+        cell = self.cellSize
+        for (x, y, q) in charges:
+            fx = min(max(x / cell, 0), self.cols - 1.000001)
+            fy = min(max(y / cell, 0), self.rows - 1.000001)
+            col, row = int(fx), int(fy)
+            tx, ty = fx - col, fy - row
+            shares.append((row, col, q * (1-tx) * (1-ty)))
+            shares.append((row, col+1, q * tx * (1-ty)))
+            shares.append((row+1, col, q * (1-tx) * ty))
+            shares.append((row+1, col+1, q * tx * ty))
+        return shares
+
+    ##########################SOLVERS############################
+    def numpySolve(self, charges):
+        if self.kernel is None:
+            self.kernel = np.fft.rfft2(np.array(self.kernelValues()))
+        rho = np.zeros((self.padRows, self.padCols))
+        if len(charges) > 0:
+            shares = np.array(self.deposit(charges))
+            np.add.at(rho, (shares[:, 0].astype(int),
+                            shares[:, 1].astype(int)), shares[:, 2])
+        v = np.fft.irfft2(np.fft.rfft2(rho) * self.kernel,
+                          s=(self.padRows, self.padCols))
+        v = v[:self.rows, :self.cols]
+        h = self.cellSize / self.meter
+        (dvdy, dvdx) = np.gradient(v, h)
+        #canvas rows go down, so E up is +dV/drow
+        self.potential = v.ravel().tolist()
+        self.ex = (-dvdx).ravel().tolist()
+        self.ey = dvdy.ravel().tolist()
+
+    def pythonSolve(self, charges):
+        if self.kernel is None:
+            self.kernel = fft2(self.kernelValues())
+        rho = [[0j] * self.padCols for row in range(self.padRows)]
+        for (row, col, share) in self.deposit(charges):
+            rho[row][col] += share
+        rhoHat = fft2(rho)
+        product = [[rhoHat[r][c] * self.kernel[r][c]
+                    for c in range(self.padCols)]
+                   for r in range(self.padRows)]
+        v = fft2(product, inverse=True)
+        scale = 1 / (self.padRows * self.padCols)
+        rows, cols = self.rows, self.cols
+        potential = []
+        for r in range(rows):
+            for c in range(cols):
+                potential.append(v[r][c].real * scale)
+        self.potential = potential
+        self.ex, self.ey = self.gradient(potential)
+
+    def gradient(self, potential):
+        #central differences inside, one-sided at the edges
+        rows, cols = self.rows, self.cols
+        h = self.cellSize / self.meter
+        ex, ey = [0.0] * (rows*cols), [0.0] * (rows*cols)
+        for r in range(rows):
+            for c in range(cols):
+                c0, c1 = max(c-1, 0), min(c+1, cols-1)
+                r0, r1 = max(r-1, 0), min(r+1, rows-1)
+                ex[r*cols + c] = -((potential[r*cols + c1] -
+                                    potential[r*cols + c0]) / ((c1-c0) * h))
+                ey[r*cols + c] = ((potential[r1*cols + c] -
+                                   potential[r0*cols + c]) / ((r1-r0) * h))
+        return (ex, ey)
+
+    ##########################LOOKUPS############################
+    def interpolate(self, values, x, y):
+        cell, cols = self.cellSize, self.cols
+        fx = min(max(x / cell, 0), cols - 1.000001)
+        fy = min(max(y / cell, 0), self.rows - 1.000001)
+        col, row = int(fx), int(fy)
+        tx, ty = fx - col, fy - row
+        i = row*cols + col
+        return ((values[i] * (1-tx) + values[i+1] * tx) * (1-ty) +
+                (values[i+cols] * (1-tx) + values[i+cols+1] * tx) * ty)
+
+    def voltageAt(self, x, y):
+        return self.interpolate(self.potential, x, y)
+
+    def fieldVectors(self, points):
+        #[(ex, ey)] like fieldengine.calcFieldVectors
+        return [(self.interpolate(self.ex, x, y),
+                 self.interpolate(self.ey, x, y)) for (x, y) in points]
+
+    def netFields(self, points):
+        #[magnitude, angle] like fieldengine.calcNetFields
+        netFields = []
+        for (ex, ey) in self.fieldVectors(points):
+            netFields.append(kernels.polar(ex, ey))
+        return netFields
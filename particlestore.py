@@ -0,0 +1,82 @@
+# particlestore.py
+# Struct-of-arrays storage for charges. Every particle is one slot in a set
+# of contiguous array('d') columns (position, velocity, charge, mass, radius)
+# plus an array('B') of flags; Particle objects are small __slots__ views that
+# read and write their slot. Kernels can walk the columns directly (or wrap
+# them with numpy.frombuffer for the duration of a call).
+
+from array import array
+
+CLICKED = 1
+
+COLUMNS = ('x', 'y', 'vx', 'vy', 'charge', 'mass', 'radius')
+
+class ParticleStore(object):
+    def __init__(self):
+        for name in COLUMNS:
+            setattr(self, name, array('d'))
+        self.flags = array('B')
+        self.views = [] #views[i] is the Particle using slot i
+
+    def __len__(self):
+        return len(self.views)
+
+    def add(self, view, x, y, charge, mass, radius, vx=0, vy=0, flags=0):
+        #returns the slot index for view
+        self.x.append(x)
+        self.y.append(y)
+        self.vx.append(vx)
+        self.vy.append(vy)
+        self.charge.append(charge)
+        self.mass.append(mass)
+        self.radius.append(radius)
+        self.flags.append(flags)
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def row(self, index):
+        values = [getattr(self, name)[index] for name in COLUMNS]
+        return values + [self.flags[index]]
+
+    def remove(self, view):
+        #O(1): the last slot moves into the hole. The removed view is moved
+        #to a store of its own so anything still holding it keeps working.
+        index, last = view.index, len(self.views) - 1
+        detached = ParticleStore()
+        (x, y, vx, vy, charge, mass, radius, flags) = self.row(index)
+        if index != last:
+            for name in COLUMNS:
+                column = getattr(self, name)
+                column[index] = column[last]
+            self.flags[index] = self.flags[last]
+            self.views[index] = self.views[last]
+            self.views[index].index = index
+        for name in COLUMNS:
+            getattr(self, name).pop()
+        self.flags.pop()
+        self.views.pop()
+        view.store = detached
+        view.index = detached.add(view, x, y, charge, mass, radius, vx, vy,
+                                  flags)
+
+    def charges(self):
+        #(x, y, charge) per slot, the form the field/force kernels take
+        return list(zip(self.x, self.y, self.charge))
+
+def column(name):
+    #property that reads/writes one column of the particle's slot
+    def get(self):
+        return getattr(self.store, name)[self.index]
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(get, set)
+
+def flag(bit):
+    def get(self):
+        return bool(self.store.flags[self.index] & bit)
+    def set(self, value):
+        if value:
+            self.store.flags[self.index] |= bit
+        else:
+            self.store.flags[self.index] &= ~bit & 0xff
+    return property(get, set)
@@ -1,32 +1,65 @@
 # events-example0.py
 # Barebones timer, mouse, and keyboard events
 
-from tkinter import *
-
 # MODEL VIEW CONTROLLER (MVC)
 ####################################
-# MODEL:       the data
+# MODEL:       the Simulation (importable and steppable without Tk)
 # VIEW:        redrawAll and its helper functions
 # CONTROLLER:  event-handling functions and their helper functions
 ####################################
 
 import math
 import string
+from array import array
+import kernels
+import glyphs
+import fieldengine
+import fieldgrid
+import forces
+import integrator
+import equipotential
+import potentialgrid
+import particlestore
+import spatialhash
+import polyline
+import expressions
+import fieldlines
+import recorder
+import collisions
+import meshsolver
+import timeseries
+import snapshot
+from profiler import FrameProfiler
 ####################################
 # customize these functions
 ####################################
 
 class Particle(object):
+    #a view over one slot of a ParticleStore: position, velocity (m/s, used
+    #by the Verlet integrator), charge, mass, radius and the click flag live
+    #in the store's arrays; only what no kernel needs is kept here
+    __slots__ = ('store', 'index', 'color', 'vel', 'force', 'angForce', 'acc')
     k = 8.9876*10**9
-    def __init__(self, x, y, data):
-        self.r = 20
-        self.x = x
-        self.y = y
-        self.isClicked = False
+    x = particlestore.column('x')
+    y = particlestore.column('y')
+    vx = particlestore.column('vx')
+    vy = particlestore.column('vy')
+    charge = particlestore.column('charge')
+    mass = particlestore.column('mass')
+    r = particlestore.column('radius')
+    isClicked = particlestore.flag(particlestore.CLICKED)
+
+    def __init__(self, x, y, data, store=None):
+        #particles that are not in a simulation (the palette ones) get a
+        #store of their own
+        if store is None:
+            store = particlestore.ParticleStore()
+        self.store = store
+        self.index = store.add(self, x, y, -1 * 10**-9,
+                               1.673 * 10 ** -27, #kilograms
+                               20)
         self.color = 'blue'
-        self.charge = -1 * 10**-9
         self.vel = 0
-        self.mass = 1.673 * 10 ** -27 #kilograms
         
     def draw(self, canvas):
         cx, cy, r = self.x, self.y, self.r
@@ -36,97 +69,51 @@ class Particle(object):
         self.x = x
         self.y = y
         
-    def followPath(self, path):
-        #for coord in path.pathList:
-        if path.pathList != []:
-            coord = (path.pathList.pop(0))
+    def followPath(self, path, seconds):
+        coord = path.advance(seconds)
+        if coord is not None:
             self.move(coord[0], coord[1])
     
-    def moveInMotion(self, data):
+    def moveInMotion(self, data, forceVec=None):
         #move in motion at velocity
-        self.updateVel(data)
+        #forceVec is an already computed [force, angle]; None computes it here
+        #overlaps are sorted out afterwards for all particles at once
+        #(collisions.holdTouchingOpposites)
+        self.updateVel(data, forceVec)
         dx = self.vel*math.cos(self.angForce)/data.meter
         dy = self.vel*math.sin(self.angForce)/data.meter
-       #find old distances
-        distances = []
-        for particleList in data.particles:
-            for particle in particleList:
-                if particle != self:
-                    d = self.distance((particle.x, particle.y))
-                    distances.append((d, self.charge, particle.charge))
         self.move(self.x + dx, self.y + dy) #move particle
         
-        #check new distances
-        newDistances = []
-        for particleList in data.particles:
-            for particle in particleList:
-                if particle != self:
-                    d = self.distance((particle.x, particle.y))
-                    newDistances.append(d)
-        for i in range(len(distances)):
-            #if opposite charges
-            if ((distances[i][1]/abs(distances[i][1])) == 
-                -1*(distances[i][2]/abs(distances[i][2]))):
-                if (newDistances[i] > distances[i][0] or 
-                    newDistances[i] < 2*self.r): 
-                    self.move(self.x - dx, self.y - dy) 
-        
-    def updateVel(self, data):
-        self.calcAcceleration(data)
+    def updateVel(self, data, forceVec=None):
+        self.calcAcceleration(data, forceVec)
         self.vel += self.acc
         self.vel /= 10**15
     
-    def calcAcceleration(self, data):
-        forceVec = self.calcNetForce(data.particles, data)
+    def calcAcceleration(self, data, forceVec=None):
+        if forceVec is None:
+            forceVec = self.calcNetForce(data.particles, data)
         self.force = forceVec[0]
         self.angForce = forceVec[1]
         self.acc = self.force/self.mass
         
     def calcNetForce(self, particles, data):
-        netF = [[],[]]
-        for particleList in data.particles:
+        #[force, angle] with the angle in canvas directions
+        others = []
+        for particleList in particles:
             for particle in particleList:
                 if particle != self:
-                    (force, ang) = self.calcForce(particle, data)
-                    netF[0].append(force)
-                    netF[1].append(ang) #polar form
-            
-        vecSum = [0,0] # rectangular form
-        for i in range(len(netF[0])):
-            newVec = [netF[0][i] * math.cos(netF[1][i]), 
-                      netF[0][i] * math.sin(netF[1][i])]
-            vecSum[0] += newVec[0]
-            vecSum[1] += newVec[1]
-        avgAng = math.atan2(vecSum[1], vecSum[0])
-        #convert vecSum to polar form
-        vecSum[0] = math.sqrt((vecSum[0]**2)+(vecSum[1]**2))
-        vecSum[1] = avgAng
-        return vecSum
-    
-    def calcForce(self, particle, data):
-        r = self.distance((particle.x, particle.y)) / (data.meter)
-        if r == 0:
-            r = .01
-        force = particle.k * self.charge * particle.charge / (r**2)
-        diffX = (self.x - particle.x) / (data.meter) #in meters
-        diffY = (self.y - particle.y) / (data.meter) #in meters
-        ang = abs(math.atan2(diffY,diffX))
-        if diffX<0 and diffY>0: #4th Quadrant
-            ang = abs(math.atan2(diffX,diffY))
-            ang = math.pi/2 + ang
-        elif diffX<0 and diffY<0: #1st Quad
-            ang = abs(math.atan2(diffX,diffY)) + math.pi/2
-        elif diffX>0 and diffY<0: #2nd Quad
-            ang = abs(ang)
-            ang = 2*math.pi - ang
-        return (force, ang)
+                    others.append((particle.x, particle.y, particle.charge))
+        (fx, fy) = kernels.forceAt(self.x, self.y, self.charge, others,
+                                   data.meter, self.k)
+        return kernels.polar(fx, fy)
     
     def distance(self, p1):
         return math.sqrt((self.x - p1[0])**2 + (self.y - p1[1])**2)
             
 class Proton(Particle):
-    def __init__(self, x, y, data):
-        super().__init__(x, y, data)
+    __slots__ = ()
+    def __init__(self, x, y, data, store=None):
+        super().__init__(x, y, data, store)
         self.color = 'red'
         self.charge = 1 * 10 **-9
         self.mass = 1.673 * 10 ** -27 #kilograms
@@ -152,6 +139,7 @@ class Proton(Particle):
         canvas.create_polygon(crossCoord, fill = 'white')
         
 class Electron(Particle):
+    __slots__ = ()
     def _init__(self, x, y, data):
         super().__init__(x, y, data)
         self.color = 'blue'
@@ -167,140 +155,46 @@ class Electron(Particle):
                                 cx+width/2, cy+height, fill = 'white',
                                 outline = 'white')
 class Field(object):
-    def __init__(self, x, y, data):
+    def __init__(self, x, y, data, scale=1):
         self.x = x
         self.y = y
-        self.width = 12.5
-        self.height = 5
-        self.arrowW = 10
-        self.angle = 0
-        self.getCoord()
-        self.xCoeff = 1
-        self.yCoeff = 1
+        #scale shrinks the arrow to fit finer grids
+        self.glyphs = glyphs.arrowTable(scale)
+        self.setNetVector([0, 0])
 
     def draw(self, canvas):
-        canvas.create_polygon(self.coord, 
-            outline = 'white', fill = 'white')
-    def getCoord(self):
-        x, y, width, height = self.x, self.y, self.width, self.height
-        arrowW = self.arrowW
-        self.coord = [(x-width, y-height), #top-left
-                 (x+width, y-height), #top-right
-                 (x+width, y-2*height), #top-arrow-point
-                 (x+width+arrowW, y), #right-most arrow point
-                 (x+width, y+2*height), #bottom-arrow-point
-                 (x+width, y+height), 
-                 (x-width, y+height)]
-    def turn(self, dAngle):
-        for i in range(len(self.coord)):
-            self.coord[i] = self.rotate((self.coord[i]), dAngle)
-    
-    def rotate(self, point, angle):
-        #Counterclockwise rotates a single point
-        cx, cy = self.x, self.y
-        (x, y) = point
-        qx = cx + math.cos(angle) * (x - cx) + math.sin(angle) * (y - cy)
-        qy = cy - math.sin(angle) * (x - cx) + math.cos(angle) * (y - cy)
-        return (qx, qy)
+        x, y = self.x, self.y
+        canvas.create_polygon([(x + dx, y + dy) for (dx, dy) in self.shape],
+                              outline = self.fill, fill = self.fill)
         
     def point(self, particles, data):
-        self.netVector = self.calcNetField(particles, data)
-        angle = self.netVector[1]
-        dAngle = angle - self.angle
-        self.turn(dAngle)
-        self.angle = angle
+        self.setNetVector(self.calcNetField(particles, data))
+
+    def setNetVector(self, netVector):
+        #pick the arrow for an already computed [magnitude, angle]
+        self.netVector = netVector
+        (self.shape, self.fill) = self.glyphs.shape(netVector[0],
+                                                    netVector[1])
 
     def calcNetField(self, particles, data):
-        netF = [[],[]]
-        for particleList in data.particles:
-            for particle in particleList:
-                eField = self.calcField(particle, data)
-                netF[0].append(eField[0])
-                netF[1].append(eField[1]) #polar form
-            
-        vecSum = [0,0] # rectangular form
-        for i in range(len(netF[0])):
-            newVec = [netF[0][i] * math.cos(netF[1][i]), 
-                      netF[0][i] * math.sin(netF[1][i])]
-            vecSum[0] += newVec[0]
-            vecSum[1] += newVec[1]
-        avgAng = math.atan2(vecSum[1], vecSum[0])
-        #convert vecSum to polar form
-        vecSum[0] = math.sqrt((vecSum[0]**2)+(vecSum[1]**2))
-        vecSum[1] = avgAng
-        return vecSum
-    
-    def calcField(self, particle, data):
-        r = self.distance((particle.x, particle.y)) / (data.meter)
-        if r == 0:
-            r = .01
-        eField = particle.k * particle.charge / (r**2)
-        diffX = (self.x - particle.x) / data.meter #in meters
-        diffY = (particle.y - self.y) / data.meter #in meters
-        ang = abs(math.atan2(diffY,diffX))
-        if diffX<0 and diffY>0: #4th Quadrant
-            ang = abs(math.atan2(diffX,diffY))
-            ang = math.pi/2 + ang
-        elif diffX<0 and diffY<0: #1st Quad
-            ang = abs(math.atan2(diffX,diffY)) + math.pi/2
-        elif diffX>0 and diffY<0: #2nd Quad
-            ang = abs(ang)
-            ang = 2*math.pi - ang
-        return (eField, ang)
+        #[magnitude, angle] with the angle measured up from +x
+        (ex, ey) = kernels.fieldAt(self.x, self.y,
+                                   fieldengine.chargesOf(particles),
+                                   data.meter, Particle.k)
+        return kernels.polar(ex, ey)
         
     def distance(self, p1):
         return math.sqrt((self.x - p1[0])**2 + (self.y - p1[1])**2)
     
-    def matchFunction(self, row, col, xCoeff, yCoeff, data):
-        self.calcFuncField(row, col, xCoeff, yCoeff, data)
-        self.pointWithFunc()
-                
-    def calcFuncField(self, row, col, xCoeff, yCoeff, data):
-        y = row - (len(data.fields)/2)
-        x = col - (len(data.fields[0])/2)
-        # eval function
-        xField = xCoeff * x
-        yField = yCoeff * y
-        self.netVector = []
-        mag = math.sqrt(xField**2 + yField**2)
-        self.netVector.append(mag)
-        ang = abs(math.atan2(yField,xField))
-        if x>0 and y<0: #3rd Quad
-            ang = math.pi + ang
-        elif x<0 and y<0: #2nd Quad
-            ang = ang
-        elif x<0 and y>0: #1st Quad
-            ang = math.pi - ang
-        elif x>0 and y>0: #4th Quad
-            ang *= -1
-        if x == 0:
-            if y < 0:
-                ang = math.pi
-            else:
-                ang = 0
-        if y == 0:
-            if x < 0:
-                ang = math.pi/2
-            else:
-                ang = 3*math.pi/2
-        self.netVector.append(ang)
-        
-    def pointWithFunc(self):
-        angle = self.netVector[1]
-        dAngle = angle - self.angle
-        self.turn(dAngle)
-        self.angle = angle
-        
 class Sensor(Field):
     def __init__(self, x, y, data):
         super().__init__(x, y, data)
         self.color = 'yellow'
         self.r = 10
-        self.width = 12.5
-        self.height = 5
-        self.arrowW = 10
         self.isClicked = False
         self.netF = self.calcNetField(data.particles, data)
+        #field magnitude (V/m) at every measurement
+        self.history = timeseries.DecimatedSeries()
         
     def draw(self, canvas):
         cx, cy, r = self.x, self.y, self.r
@@ -330,6 +224,8 @@ class Voltmeter(Sensor):
                            self.mainy]
         self.volts = 0
         self.isClicked = False
+        #volts at every measurement
+        self.history = timeseries.DecimatedSeries()
         
         #circle coord:
         self.x, self.y = self.mainx, self.mainy-(1.25*self.ry)
@@ -346,7 +242,11 @@ class Voltmeter(Sensor):
         canvas.create_oval(cx-r, cy-r, cx+r, cy+r, outline = 'red')
     
     def move(self, x, y, data):
-        super().move(x, y, data)
+        #the field at the voltmeter is never shown, so only the volts are
+        #refreshed (a raster lookup when the raster is current)
+        self.x = x
+        self.y = y
+        self.volts = data.voltageAt(self.x, self.y)
         self.mainx = self.x
         self.mainy = self.y + (1.25*self.ry)
         self.screenCord = [self.mainx-self.rx+self.margin, 
@@ -354,30 +254,10 @@ class Voltmeter(Sensor):
                            self.mainx+self.rx-self.margin, 
                            self.mainy]
     
-    def calcVolt(self, particle, data):
-        #electricField
-        self.elecField = self.calcField(particle, data)
-        d = self.distance((particle.x, particle.y)) / data.meter
-        volt = abs(self.elecField[0]*d)
-        if particle.charge < 0:
-            mult = -1
-        else:
-            mult = 1
-        volt *= mult
-        return volt
-    
     def calcNetVolt(self, data):
-        netVolt = []
-        for particleList in data.particles:
-            for particle in particleList:
-                volt = self.calcVolt(particle, data)
-                netVolt.append(volt)
-                
-        netVoltMag = 0
-        for volt in netVolt:
-            netVoltMag += volt
-            
-        self.volts = netVoltMag
+        self.volts = kernels.potentialAt(self.x, self.y,
+                                         fieldengine.chargesOf(data.particles),
+                                         data.meter, Particle.k)
     
     def pulse(self, data):
         ogX, ogY, ogF = self.x, self.y, self.volts
@@ -399,6 +279,16 @@ class Voltmeter(Sensor):
                     r+=1
         self.x, self.y, self.volts = ogX, ogY, ogF
         return coord
+
+    def trace(self, data, step=4):
+        #equipotential lines through the voltmeter's reading, as polylines
+        charges = data.charges()
+        target = equipotential.potential(self.x, self.y, charges, data.meter,
+                                         Particle.k)
+        return equipotential.traceEquipotentials(target, charges, data.meter,
+                                                 data.width, data.height,
+                                                 [(self.x, self.y)],
+                                                 Particle.k, step)
         
 class startScreen(object):
     def __init__(self, data):
@@ -500,7 +390,7 @@ point accordingly.'''),
 '''Place some particles onto the field and press 'm' to begin. The particles will 
 move in the appropriate direction with the appropriate force, velocity, and acceleration. However,
 in real life, small particles like these would move extremely fast, so this program displays the 
-movements 10^15 times slower.'''),
+movements millions of times slower.'''),
                            fill = 'red', font = ('Courier', 15))
         canvas.create_text(self.instructionsX, 
                            self.instructionsY + 12*self.instructionsStep, 
@@ -514,19 +404,55 @@ x-vector function and y-vector function you input.'''),
                            fill = 'red', font = ('Courier', 15))
                            
 class Path(object):
-    def __init__(self, data):
+    #raw mouse samples while it is drawn; finish() keeps only the points
+    #needed to stay within tolerance pixels of them, and playback moves
+    #along the result at speed px/s however densely the mouse was sampled
+    def __init__(self, data, speed=300, tolerance=1.5):
         self.r = 10
-        self.pathList = []
+        self.xs = array('d')
+        self.ys = array('d')
+        self.speed = speed
+        self.tolerance = tolerance
+        self.cursor = None
+        self.started = False
         
     def draw(self, canvas):
-        r = self.r
-        if len(self.pathList)>1:
-            for coord in self.pathList:
-                canvas.create_oval(coord[0]-r, coord[1]-r, 
-                                   coord[0]+r, coord[1]+r, fill = 'green', 
-                                   outline = 'green')
+        #one thick round-capped line looks like the old row of dots
+        if len(self.xs)>1:
+            coords = []
+            for i in range(len(self.xs)):
+                coords.append(self.xs[i])
+                coords.append(self.ys[i])
+            canvas.create_line(coords, fill = 'green', width = 2*self.r,
+                               capstyle = 'round', joinstyle = 'round')
+
     def addToPath(self, x, y):
-        self.pathList.append((x, y))
+        if self.cursor is None:
+            self.xs.append(x)
+            self.ys.append(y)
+
+    def finish(self):
+        if self.cursor is not None:
+            return
+        keep = polyline.simplify(self.xs, self.ys, self.tolerance)
+        self.xs = array('d', [self.xs[i] for i in keep])
+        self.ys = array('d', [self.ys[i] for i in keep])
+        self.cursor = polyline.Cursor(self.xs, self.ys,
+                                      polyline.arcLengths(self.xs, self.ys))
+
+    def isDone(self):
+        return self.started and self.cursor.atEnd()
+
+    def advance(self, seconds):
+        #where the particle is after seconds more of playback; the first
+        #call puts it on the start, None once the end has been reached
+        self.finish()
+        if not self.started:
+            self.started = True
+            return self.cursor.point()
+        if self.cursor.atEnd():
+            return None
+        return self.cursor.advance(self.speed * seconds)
 
 class Button(object):
     def __init__(self, x, y, width, height, color):
@@ -549,14 +475,18 @@ class Button(object):
             return True
         return False
 
+#what can be typed into the function mode boxes
+FUNCTION_CHARACTERS = string.ascii_letters + string.digits + '+-*/^%.(), '
+
 class TextBox(object):
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, text='1', allowed=string.digits):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
         self.color = 'white'
-        self.text = '1'
+        self.text = text
+        self.allowed = allowed
         self.isClicked = False
         
     def draw(self, canvas):
@@ -573,23 +503,612 @@ class TextBox(object):
             return True
         return False
     
-    def addText(self, dig):
-        nums = string.digits
-        if dig in nums:
+    def addText(self, key, char=None):
+        #key is the Tk keysym, char the character it types (if any)
+        if char is None:
+            char = key
+        if len(char) == 1 and char in self.allowed:
             if self.text == '0':
-                self.text = dig
+                self.text = char
             else:
-                self.text = self.text + dig
-        elif dig == 'BackSpace':
+                self.text = self.text + char
+        elif key == 'BackSpace':
             length = len(self.text)
             self.text = self.text[0:length-1]
         if len(self.text) == 0:
             self.text = '0'
     
+class Simulation(object):
+    #the model without any Tk: owns the particles, sensors, field grid and
+    #voltmeter. It is passed anywhere the objects above expect "data".
+    def __init__(self, width=1000, height=800, gridSize=8,
+                 adaptiveGrid=False):
+        self.width = width
+        self.height = height
+        #unit conversion
+        self.meter = self.width/10
+
+        #every charge's numbers live here; protons/electrons are views
+        self.store = particlestore.ParticleStore()
+
+        #list of objects
+        self.protons = []
+        self.electrons = []
+        self.particles = [self.protons, self.electrons]
+        self.sensors = []
+        #protons, electrons and sensors bucketed by position, for clicks and
+        #the trash; anything that moves them calls reindex
+        self.spatialHash = spatialhash.SpatialHash(40)
+        #gridSize x gridSize arrows, spread over the same area as the
+        #original 8x8 grid
+        self.gridSize = gridSize
+        self.fields = []
+        self.initFields()
+        #potential sampled every cellSize pixels, rebuilt only when charges
+        #change; the voltmeter and voltageAt read it by interpolation
+        self.potentialRaster = potentialgrid.PotentialRaster(self.width,
+                                                             self.height, 10)
+        self.useRaster = True
+        #charges at the last measurement and whether the one before saw
+        #the same; the raster is only rebuilt for charges that stand still
+        self.measuredCharges = None
+        self.chargesStatic = False
+        #'direct' sums every charge for every arrow, sensor and voltmeter;
+        #'mesh' reads them off a particle-mesh (FFT) solve instead; 'auto'
+        #uses the mesh from meshAbove charges on, and only with NumPy
+        self.fieldSolver = 'auto'
+        self.meshAbove = 2000
+        self.mesh = meshsolver.ParticleMesh(self.width, self.height,
+                                            self.meter, 8, Particle.k)
+        #adaptive mode: quadtree arrows over that area instead, refined
+        #where the field changes quickly and only rebuilt when charges change
+        self.adaptiveGrid = adaptiveGrid
+        self.quadGrid = fieldgrid.AdaptiveGrid(self.width/25, self.height/20,
+                                               8.5*self.width/12.5,
+                                               8.5*self.height/10)
+        self.adaptiveFields = []
+        self.chargeSignature = None
+        self.voltmeter = Voltmeter(self)
+
+        self.trash = [self.width/15, 18.5*self.height/20, self.width/5,
+                      19.5*self.height/20]
+        self.paths = []
+        #seconds of playback one step() stands for (the GUI tick length)
+        self.tickTime = 1/120
+        self.equipLines = []
+        #field lines from the positive charges, retraced only when a charge
+        #moves
+        self.showFieldLines = False
+        self.fieldLines = []
+        self.fieldLineSignature = None
+
+        self.fieldExists = False
+        #evaluate the arrow grid and sensors in one batch (numpy if present)
+        self.batchFields = True
+        #motion mode force engine: 'direct' sums every pair once,
+        #'barneshut' uses one quadtree (opening angle theta) and falls back
+        #to the direct sum below directBelow particles; in plain Python the
+        #tree only starts to win at around a thousand (python benchmarks.py)
+        self.forceEngine = 'direct'
+        self.theta = .5
+        self.directBelow = 1000
+        #motion mode moves particles with fixed physical time steps;
+        #None goes back to the old one-move-per-tick Particle.moveInMotion
+        self.integrator = integrator.VerletIntegrator()
+        self.time = 0 #physical seconds simulated in motion mode
+        #per-phase timings and counts of recent frames (off by default)
+        self.profiler = FrameProfiler()
+        #writes every step's positions to a file while recording
+        self.recorder = None
+        #sensor and voltmeter readings are kept in bounded histories; the
+        #time axis counts measurements
+        self.logProbes = True
+        self.measurements = 0
+        self.initModes()
+
+    def initFields(self):
+        spacing = 8/self.gridSize
+        scale = min(1, spacing)
+        for row in range(1, self.gridSize+1):
+            newList = []
+            for col in range(1, self.gridSize+1):
+                newList.append(Field(row*spacing*self.width/12.5,
+                                     col*spacing*self.height/10, self, scale))
+            self.fields.append(newList)
+
+    def setGridSize(self, gridSize):
+        self.gridSize = gridSize
+        self.fields = []
+        self.initFields()
+
+    def activeFields(self):
+        #the arrows currently shown, as a flat list
+        if self.adaptiveGrid and not self.functionMode:
+            return self.adaptiveFields
+        fields = []
+        for fieldList in self.fields:
+            fields.extend(fieldList)
+        return fields
+
+    def initModes(self):
+        #path mode
+        self.pathMode = False
+        self.particleForPath = []
+        self.drawingPath = False
+        self.finishedDrawingAllPaths = True
+
+        #motion mode
+        self.motionMode = False
+
+        #function mode
+        self.functionMode = False
+        #arrows show (xFunc, yFunc) of x and y in meters from the middle of
+        #the grid, y up; compiled once and evaluated once per grid
+        self.xFunc = 'x'
+        self.yFunc = 'y'
+        self.vectorFunction = expressions.VectorFunction(self.xFunc,
+                                                         self.yFunc)
+        self.functionError = None
+        self.functionSignature = None
+
+    def addProton(self, x, y):
+        proton = Proton(x, y, self, self.store)
+        self.protons.append(proton)
+        self.spatialHash.insert(proton)
+        return proton
+
+    def addElectron(self, x, y):
+        electron = Electron(x, y, self, self.store)
+        self.electrons.append(electron)
+        self.spatialHash.insert(electron)
+        return electron
+
+    def addSensor(self, x, y):
+        sensor = Sensor(x, y, self)
+        self.sensors.append(sensor)
+        self.spatialHash.insert(sensor)
+        return sensor
+
+    def removeParticle(self, particle):
+        if particle in self.spatialHash:
+            self.spatialHash.remove(particle)
+            if isinstance(particle, Proton):
+                self.protons.remove(particle)
+            else:
+                self.electrons.remove(particle)
+            self.store.remove(particle)
+
+    def removeSensor(self, sensor):
+        if sensor in self.spatialHash:
+            self.spatialHash.remove(sensor)
+            self.sensors.remove(sensor)
+
+    def reindex(self, obj):
+        #call after moving a particle or sensor outside of step()
+        self.spatialHash.update(obj)
+
+    def reindexParticles(self):
+        for view in self.store.views:
+            self.spatialHash.update(view)
+
+    def addPath(self, particle):
+        #the particle follows the returned path once path mode is played
+        path = Path(self)
+        self.particleForPath.append(particle)
+        self.paths.append(path)
+        return path
+
+    def allParticles(self):
+        return self.protons + self.electrons
+
+    def particleCount(self):
+        return len(self.protons) + len(self.electrons)
+
+    def charges(self):
+        #(x, y, charge) of every particle, straight from the store
+        return self.store.charges()
+
+    def energy(self):
+        #(kinetic, potential) in joules: 1/2 m v^2 over the particles and
+        #k q1 q2 / r over every pair (pairs at the same point are skipped)
+        store, meter = self.store, self.meter
+        kinetic = 0
+        for i in range(len(store)):
+            kinetic += store.mass[i] * (store.vx[i]**2 + store.vy[i]**2) / 2
+        potential = 0
+        charges = store.charges()
+        for i in range(len(charges)):
+            (x0, y0, q0) = charges[i]
+            for j in range(i+1, len(charges)):
+                (x1, y1, q1) = charges[j]
+                r = math.sqrt((x1 - x0)**2 + (y1 - y0)**2) / meter
+                if r > 0:
+                    potential += Particle.k * q0 * q1 / r
+        return (kinetic, potential)
+
+    def isIdle(self):
+        #True when stepping would change nothing: no motion, no path being
+        #played back and nothing being dragged
+        if self.motionMode:
+            return False
+        if (self.pathMode and not self.drawingPath and
+            self.finishedDrawingAllPaths):
+            for path in self.paths:
+                if not path.isDone():
+                    return False
+        return (len(self.clickedObjects()) == 0 and
+                not self.voltmeter.isClicked)
+
+    def clickedObjects(self):
+        #particles and sensors being dragged; the particles are found by
+        #scanning the store's flag bytes
+        clicked = []
+        flags = bytes(self.store.flags)
+        mark = bytes([particlestore.CLICKED])
+        i = flags.find(mark)
+        while i != -1:
+            clicked.append(self.store.views[i])
+            i = flags.find(mark, i+1)
+        for sensor in self.sensors:
+            if sensor.isClicked:
+                clicked.append(sensor)
+        return clicked
+
+    def objectsAt(self, x, y):
+        #particles and sensors under a canvas point
+        return self.spatialHash.queryPoint(x, y)
+
+    def topmost(self, objects, kinds):
+        #the object the old click scan reached first: kinds in order, and
+        #within a kind the most recently added
+        best, bestKey = None, None
+        for obj in objects:
+            for i in range(len(kinds)):
+                if isinstance(obj, kinds[i]):
+                    key = (i, -self.spatialHash.serial(obj))
+                    if bestKey is None or key < bestKey:
+                        best, bestKey = obj, key
+                    break
+        return best
+
+    ##########################QUERIES############################
+    def fieldAt(self, x, y):
+        #net electric field (V/m, angle) at a canvas point
+        return Field(x, y, self).calcNetField(self.particles, self)
+
+    def voltageAt(self, x, y):
+        #raster lookup while the charges stand still; while they move,
+        #rebuilding the raster for every probe (every mouse event over a
+        #dragged voltmeter) costs far more than one exact sum, so the
+        #exact sum is used until they stop
+        charges = self.charges()
+        if self.useMesh(charges):
+            return self.solveMesh(charges).voltageAt(x, y)
+        if self.useRaster:
+            if self.potentialRaster.matches(charges):
+                return self.potentialRaster.sample(x, y)
+            if self.chargesStatic and tuple(charges) == self.measuredCharges:
+                self.potentialRaster.update(charges, self.meter, Particle.k)
+                return self.potentialRaster.sample(x, y)
+        return kernels.potentialAt(x, y, charges, self.meter, Particle.k)
+
+    def forceOn(self, particle):
+        #net force (N, angle) on a particle from all the others
+        return particle.calcNetForce(self.particles, self)
+
+    def traceFieldLines(self):
+        charges = self.charges()
+        signature = tuple(charges)
+        if signature != self.fieldLineSignature:
+            self.fieldLineSignature = signature
+            with self.profiler.phase('fieldLines'):
+                self.fieldLines = fieldlines.traceFieldLines(
+                    charges, self.meter, self.width, self.height, Particle.k)
+        return self.fieldLines
+
+    def findEquipotential(self):
+        self.equipLines = self.voltmeter.trace(self)
+        return self.equipLines
+
+    ##########################STEPPING############################
+    def step(self):
+        #advance one tick
+        opened = self.profiler.beginFrame()
+        if self.pathMode:
+            with self.profiler.phase('paths'):
+                self.stepPaths()
+
+        self.measure()
+
+        if self.motionMode:
+            with self.profiler.phase('motion'):
+                self.stepMotion()
+
+        if self.functionMode:
+            with self.profiler.phase('function'):
+                self.stepFunction()
+        else:
+            #measure() has pointed the arrows at the charges again
+            self.functionSignature = None
+
+        if self.recorder is not None:
+            with self.profiler.phase('record'):
+                self.recorder.record(self.store, self.time)
+        if opened:
+            self.profiler.endFrame()
+
+    def advance(self, seconds):
+        #run motion physics for the given physical time in one call, then
+        #update the field, sensors and voltmeter once. While recording,
+        #every integrator frame is recorded, as step() would.
+        if self.integrator is None:
+            #the old per-tick moves have no physical time to advance by
+            raise ValueError('advance needs an integrator; use step() '
+                             'with integrator None')
+        if self.recorder is None:
+            self.integrator.advance(self, seconds)
+        else:
+            steps = self.integrator.stepsFor(seconds)
+            substeps = self.integrator.substeps
+            for start in range(0, steps, substeps):
+                self.integrator.run(self, min(substeps, steps - start))
+                self.recorder.record(self.store, self.time)
+        self.reindexParticles()
+        self.measure()
+
+    def measure(self):
+        #field arrows, sensors, trash and voltmeter for the current positions
+        signature = tuple(self.charges())
+        self.chargesStatic = signature == self.measuredCharges
+        self.measuredCharges = signature
+        if len(self.particles[0])>0 or len(self.particles[1])>0:
+            self.fieldExists = True
+        else:
+            self.fieldExists = False
+
+        profiler = self.profiler
+        if self.batchFields or self.adaptiveGrid:
+            with profiler.phase('fields'):
+                self.pointFieldsAndSensors()
+        else:
+            with profiler.phase('fields'):
+                if self.fieldExists and not self.functionMode:
+                    for fieldList in self.fields:
+                        for field in fieldList:
+                                field.point(self.particles, self)
+                    profiler.count('fieldPairs', self.gridSize**2 *
+                                   self.particleCount())
+
+            with profiler.phase('sensors'):
+                if len(self.sensors)>0:
+                    for sensor in self.sensors:
+                        sensor.netF = sensor.calcNetField(self.particles, self)
+                profiler.count('fieldPairs', len(self.sensors) *
+                               self.particleCount())
+
+        with profiler.phase('trash'):
+            self.deleteParticlesAndSensors()
+
+        with profiler.phase('voltmeter'):
+            self.readVoltmeter()
+
+        self.measurements += 1
+        if self.logProbes:
+            for sensor in self.sensors:
+                sensor.history.add(self.measurements, sensor.netF[0])
+            self.voltmeter.history.add(self.measurements, self.voltmeter.volts)
+
+        if self.showFieldLines:
+            self.traceFieldLines()
+
+    def useMesh(self, charges):
+        if self.fieldSolver == 'mesh':
+            return True
+        return (self.fieldSolver == 'auto' and meshsolver.hasNumpy() and
+                len(charges) >= self.meshAbove)
+
+    def solveMesh(self, charges):
+        #brings the mesh up to date; a no-op if the charges did not move
+        with self.profiler.phase('mesh'):
+            self.mesh.update(charges)
+        return self.mesh
+
+    def readVoltmeter(self):
+        #the raster is only used when it is already current; rebuilding it
+        #every tick while charges move costs far more than one exact sum
+        charges = self.charges()
+        if self.useMesh(charges):
+            self.voltmeter.volts = self.solveMesh(charges).voltageAt(
+                                        self.voltmeter.x, self.voltmeter.y)
+        elif self.useRaster and self.potentialRaster.matches(charges):
+            self.voltmeter.volts = self.potentialRaster.sample(
+                                        self.voltmeter.x, self.voltmeter.y)
+        else:
+            self.voltmeter.calcNetVolt(self)
+
+    def pointFieldsAndSensors(self):
+        #one batched evaluation for every arrow and sensor
+        fields = []
+        if self.fieldExists and not self.functionMode:
+            if self.adaptiveGrid:
+                self.refineAdaptiveFields()
+            else:
+                fields = self.activeFields()
+        points = [(obj.x, obj.y) for obj in fields + self.sensors]
+        if len(points) == 0:
+            return
+        charges = self.charges()
+        if self.useMesh(charges):
+            netFields = self.solveMesh(charges).netFields(points)
+        else:
+            self.profiler.count('fieldPairs', len(points) * len(charges))
+            netFields = fieldengine.calcNetFields(points, charges,
+                                                  self.meter, Particle.k)
+        for i in range(len(fields)):
+            fields[i].setNetVector(netFields[i])
+        for i in range(len(self.sensors)):
+            self.sensors[i].netF = netFields[len(fields) + i]
+
+    def refineAdaptiveFields(self):
+        signature = tuple(self.charges())
+        if signature == self.chargeSignature:
+            return
+        self.chargeSignature = signature
+        charges = self.charges()
+        def evaluate(points):
+            if self.useMesh(charges):
+                return self.solveMesh(charges).fieldVectors(points)
+            self.profiler.count('fieldPairs', len(points) * len(charges))
+            return fieldengine.calcFieldVectors(points, charges, self.meter,
+                                                Particle.k)
+        baseW, baseH = self.width/12.5, self.height/10
+        self.adaptiveFields = []
+        for cell in self.quadGrid.refine(evaluate):
+            scale = min(1, cell.width/baseW, cell.height/baseH)
+            field = Field(cell.x, cell.y, self, scale)
+            (ex, ey) = cell.vector
+            field.setNetVector(kernels.polar(ex, ey))
+            self.adaptiveFields.append(field)
+
+    def probeHistories(self):
+        #[(name, DecimatedSeries)] for every sensor and the voltmeter
+        histories = []
+        for i in range(len(self.sensors)):
+            histories.append(('sensor%d' % i, self.sensors[i].history))
+        histories.append(('voltmeter', self.voltmeter.history))
+        return histories
+
+    def toBytes(self):
+        return snapshot.toBytes(self)
+
+    @classmethod
+    def fromBytes(cls, blob):
+        #a new Simulation in the state saved by toBytes
+        return snapshot.fromBytes(blob, cls)
+
+    def save(self, path):
+        snapshot.save(self, path)
+
+    @classmethod
+    def load(cls, path):
+        return snapshot.load(path, cls)
+
+    def exportProbes(self, path):
+        timeseries.exportCSV(self.probeHistories(), path)
+
+    def startRecording(self, path, framesPerChunk=256):
+        self.stopRecording()
+        self.recorder = recorder.TrajectoryRecorder(path, self.width,
+                                                    self.height,
+                                                    framesPerChunk)
+
+    def stopRecording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def replayFrame(self, replay, index):
+        #show frame index of a TrajectoryReplay without any physics; the
+        #particles are only rebuilt when the recorded set differs
+        (time, charges, xs, ys) = replay.frame(index)
+        if self.store.charge != charges:
+            for particle in self.allParticles():
+                self.removeParticle(particle)
+            for i in range(len(charges)):
+                if charges[i] > 0:
+                    particle = self.addProton(xs[i], ys[i])
+                else:
+                    particle = self.addElectron(xs[i], ys[i])
+                self.store.charge[particle.index] = charges[i]
+        self.store.x[:] = xs
+        self.store.y[:] = ys
+        self.time = time
+        self.reindexParticles()
+        self.measure()
+
+    def run(self, steps):
+        for i in range(steps):
+            self.step()
+
+    def deleteParticlesAndSensors(self):
+        #only what lies in the trash cells is looked at
+        for obj in self.spatialHash.queryRect(*self.trash):
+            if obj.isClicked == False:
+                if isinstance(obj, Sensor):
+                    self.removeSensor(obj)
+                else:
+                    self.removeParticle(obj)
+
+    def stepPaths(self):
+        if (not self.drawingPath and self.finishedDrawingAllPaths):
+            for i in range(len(self.particleForPath)):
+                self.particleForPath[i].followPath(self.paths[i],
+                                                   self.tickTime)
+                self.reindex(self.particleForPath[i])
+
+    def stepMotion(self):
+        if self.integrator is not None:
+            self.integrator.step(self)
+            self.reindexParticles()
+            return
+        if (len(self.particles[0]) > 1 or len(self.particles[1]) > 1 or
+            len(self.particles[0]) + len(self.particles[1]) > 1):
+            #force phase: every force from the same positions, so the
+            #result does not depend on the order of the particle lists
+            particles = self.allParticles()
+            bodies = [(particle.x, particle.y, particle.charge)
+                      for particle in particles]
+            netForces = forces.calcForces(bodies, self.meter, Particle.k,
+                                          self.forceEngine, self.theta,
+                                          self.directBelow,
+                                          self.profiler.counts())
+            #integration phase, then one collision pass
+            oldX, oldY = self.store.x[:], self.store.y[:]
+            for i in range(len(particles)):
+                (fx, fy) = netForces[i]
+                particles[i].moveInMotion(self, kernels.polar(fx, fy))
+            collisions.holdTouchingOpposites(self.store, oldX, oldY,
+                                             self.profiler.counts())
+            self.reindexParticles()
+
+    def setFunctions(self, xFunc, yFunc):
+        #only recompiles when the text changed. Text that does not compile
+        #keeps the last good function and is reported in functionError.
+        if (xFunc, yFunc) == (self.xFunc, self.yFunc):
+            return self.functionError is None
+        self.xFunc, self.yFunc = xFunc, yFunc
+        try:
+            self.vectorFunction = expressions.VectorFunction(xFunc, yFunc)
+            self.functionError = None
+        except ValueError as error:
+            self.functionError = str(error)
+        return self.functionError is None
+
+    def stepFunction(self):
+        #the arrows only change with the function or the grid
+        signature = self.functionSignature
+        if (signature is not None and signature[0] is self.vectorFunction
+            and signature[1] is self.fields):
+            return
+        self.functionSignature = (self.vectorFunction, self.fields)
+        fields = self.activeFields()
+        if len(fields) == 0:
+            return
+        cx = sum([field.x for field in fields]) / len(fields)
+        cy = sum([field.y for field in fields]) / len(fields)
+        xs = [(field.x - cx) / self.meter for field in fields]
+        ys = [(cy - field.y) / self.meter for field in fields]
+        vectors = self.vectorFunction.evaluate(xs, ys)
+        for i in range(len(fields)):
+            (fx, fy) = vectors[i]
+            fields[i].setNetVector(kernels.polar(fx, fy))
+
 #Cite: Barebones structure from course notes
 # https://pd43.github.io/notes/notes4-2.html
             
 # Initialize the data which will be used to draw on the screen.
+# The model lives in data.sim (a Simulation); data itself only holds the
+# screens, buttons and other view state.
 def init(data):
     # load data as appropriate
     #screen booleans
@@ -597,9 +1116,13 @@ def init(data):
     data.startScreen = startScreen(data)
     data.instructionsOn = False
     data.instructionScreen = instructions(data)
+    data.showHud = False
+    data.showSparklines = False
+    #the scene kept with 'k' survives a restart
+    if not hasattr(data, 'savedScene'):
+        data.savedScene = None
     initButtons(data)
     initBases(data)
-    initModes(data)
     
 def initButtons(data):
     data.startButton = Button(data.startScreen.startX, data.startScreen.startY, 
@@ -613,60 +1136,20 @@ def initButtons(data):
                                 data.width/10, data.height/20, 'brown')
     #textboxes
     data.xText = TextBox(8*data.width/10, 9*data.height/20, data.width/10, 
-                         data.height/20)
+                         data.height/20, 'x', FUNCTION_CHARACTERS)
     data.yText = TextBox(8*data.width/10, 11*data.height/20, data.width/10, 
-                         data.height/20)
+                         data.height/20, 'y', FUNCTION_CHARACTERS)
     
 def initBases(data):
-    #unit conversion
-    data.meter = data.width/10
+    data.sim = Simulation(data.width, data.height)
     
     #make base of objects
     data.backgroundColor = 'black'
     data.protonBase = Proton(4*data.width/12.5, 
-                         19*data.height/20, data)
+                         19*data.height/20, data.sim)
     data.electronBase = Electron(6*data.width/12.5, 
-                         19*data.height/20, data)
-    data.voltmeter = Voltmeter(data)
-    
-    #list of objects
-    data.protons = []
-    data.electrons = []
-    data.fields = []
-    data.sensors = []
-    for row in range(1, 9):
-        newList = []
-        for col in range(1, 9):
-            newList.append(Field(row*data.width/12.5, col*data.height/10, 
-                                     data))
-        data.fields.append(newList)
-    data.particles = [data.protons, data.electrons]
-    
-    data.trash = [data.width/15, 18.5*data.height/20, data.width/5, 
-                  19.5*data.height/20]
-    
-    data.sensorBase = Sensor(8*data.width/12.5, 19*data.height/20, data)
-    data.paths = []
-    data.equipCoord = []
-    
-    data.fieldExists = False
-
-def initModes(data):
-    #MODES
-    #path mode
-    data.pathMode = False
-    data.pathModeParticleClicked = False
-    data.particleForPath = []
-    data.drawingPath = False
-    data.finishedDrawingAllPaths = True
-    
-    #motion mode
-    data.motionMode = False
-    
-    #function mode
-    data.functionMode = False
-    data.xFunc = 'x'
-    data.yFunc = 'y'
+                         19*data.height/20, data.sim)
+    data.sensorBase = Sensor(8*data.width/12.5, 19*data.height/20, data.sim)
     
 # These are the CONTROLLERs.
 # IMPORTANT: CONTROLLER does *not* draw at all!
@@ -694,8 +1177,12 @@ def mousePressed(event, data):
     elif (not data.startScreenOn) and data.yText.checkClick(event):
         data.yText.isClicked = True
         data.xText.isClicked = False 
+    else:
+        #clicking anywhere else stops typing into the boxes
+        data.xText.isClicked = False
+        data.yText.isClicked = False
             
-    if data.pathMode: 
+    if data.sim.pathMode:
         pathModeMousePressed(event, data)
         return
 
@@ -707,25 +1194,26 @@ def mousePressed(event, data):
     ableToMakeCopies(event, data)
 def moveAroundParticles(event, data):
     #be able to move around protons and electrons 
-    for i in range(len(data.protons)-1, -1, -1):
-        if toggleParticleClick(event, data, data.protons[i]):
-            return True
-    for i in range(len(data.electrons)-1, -1, -1):
-        if toggleParticleClick(event, data, data.electrons[i]): return True
-    for i in range(len(data.sensors)-1, -1, -1):
-        if toggleParticleClick(event, data, data.sensors[i]): return True
+    #only what is under the mouse or already being dragged can react, so
+    #just those are asked (in the order of the old full scan)
+    sim = data.sim
+    candidates = sim.objectsAt(event.x, event.y) + sim.clickedObjects()
+    obj = sim.topmost(candidates, [Proton, Electron, Sensor])
+    if obj is not None:
+        return toggleParticleClick(event, data, obj)
     
 def toggleVoltmeterClick(event, data):
     ####toggle Click on Voltmeter
-    diffX = abs(event.x - data.voltmeter.x)
-    diffY = abs(event.y - data.voltmeter.y)
+    voltmeter = data.sim.voltmeter
+    diffX = abs(event.x - voltmeter.x)
+    diffY = abs(event.y - voltmeter.y)
     #clicking the particle
-    if (diffX <= data.voltmeter.rx and diffY <= data.voltmeter.ry
-        and data.voltmeter.isClicked == False):
-        data.voltmeter.isClicked = True
+    if (diffX <= voltmeter.rx and diffY <= voltmeter.ry
+        and voltmeter.isClicked == False):
+        voltmeter.isClicked = True
     #unclicking particle
-    elif data.voltmeter.isClicked:
-        data.voltmeter.isClicked = False
+    elif voltmeter.isClicked:
+        voltmeter.isClicked = False
         
 def ableToMakeCopies(event, data):
     #make copies of proton or electron
@@ -737,21 +1225,18 @@ def ableToMakeCopies(event, data):
     diffYOfSens = abs(event.y - data.sensorBase.y)    
     
     if diffXOfProt <= data.protonBase.r and diffYOfProt <= data.protonBase.r:
-        data.protons.append(Proton(4*data.width/12.5, 
-                         19*data.height/20, data))
-        data.protons[-1].isClicked = True
+        data.sim.addProton(4*data.width/12.5,
+                           19*data.height/20).isClicked = True
     
     elif (diffXOfElec <= data.electronBase.r and 
           diffYOfElec <= data.electronBase.r):
-        data.electrons.append(Electron(6*data.width/12.5, 
-                         19*data.height/20, data))
-        data.electrons[-1].isClicked = True
+        data.sim.addElectron(6*data.width/12.5,
+                             19*data.height/20).isClicked = True
         
     elif (diffXOfSens <= data.sensorBase.r and 
           diffYOfSens <= data.sensorBase.r):
-        data.sensors.append(Sensor(8*data.width/12.5, 
-                         19*data.height/20, data))
-        data.sensors[-1].isClicked = True
+        data.sim.addSensor(8*data.width/12.5,
+                           19*data.height/20).isClicked = True
     
 def toggleParticleClick(event, data, particle):
     #determines if particle is clicked
@@ -771,31 +1256,33 @@ def toggleParticleClick(event, data, particle):
     return False
         
 def mouseMotion(event, data):
-    if data.pathMode:
+    sim = data.sim
+    if sim.pathMode:
         pathModeMouseMotion(event, data)
         return
     
-    for proton in data.protons:
-        if proton.isClicked:
-            proton.move(event.x, event.y)
-    
-    for electron in data.electrons:
-        if electron.isClicked:
-            electron.move(event.x, event.y)
-
-    for sensor in data.sensors:
-        if sensor.isClicked:
-            sensor.move(event.x, event.y, data)
+    for obj in sim.clickedObjects():
+        if isinstance(obj, Sensor):
+            obj.move(event.x, event.y, sim)
+        else:
+            obj.move(event.x, event.y)
+        sim.reindex(obj)
             
-    if data.voltmeter.isClicked:
-        data.voltmeter.move(event.x, event.y, data)
+    if sim.voltmeter.isClicked:
+        sim.voltmeter.move(event.x, event.y, sim)
         
 def keyPressed(event, data):
     # use event.char and event.keysym
-    if data.xText.isClicked:
-        data.xText.addText(event.keysym)
-    elif data.yText.isClicked:
-        data.yText.addText(event.keysym)
+    sim = data.sim
+    #while a function box is selected every key is typed into it
+    for textBox in [data.xText, data.yText]:
+        if textBox.isClicked:
+            if event.keysym in ('Return', 'Escape'):
+                textBox.isClicked = False
+            else:
+                textBox.addText(event.keysym, event.char)
+                checkFunctionText(textBox)
+            return
         
     if event.keysym == 'i':
         data.instructionsOn = True
@@ -808,130 +1295,95 @@ def keyPressed(event, data):
         data.startScreenOn = True
         return
     elif data.startScreenOn == False and event.keysym == 'p':
-        data.pathMode = not data.pathMode
-        if data.pathMode:
-            data.finishedDrawingAllPaths = False
-            data.motionMode = False
-            data.functionMode = False
+        sim.pathMode = not sim.pathMode
+        if sim.pathMode:
+            sim.finishedDrawingAllPaths = False
+            sim.motionMode = False
+            sim.functionMode = False
         return
     elif data.startScreenOn == False and event.keysym == 'm':
-        data.motionMode = not data.motionMode
-        if data.motionMode:
-            data.pathMode = False
-            data.functionMode = False
+        sim.motionMode = not sim.motionMode
+        if sim.motionMode:
+            sim.pathMode = False
+            sim.functionMode = False
         return
     elif data.startScreenOn == False and event.keysym == 'f':
-        data.functionMode = not data.functionMode
-        if data.functionMode:
-            data.pathMode = False
-            data.motionMode = False
-        data.fieldExists = True
+        sim.functionMode = not sim.functionMode
+        if sim.functionMode:
+            sim.pathMode = False
+            sim.motionMode = False
+        sim.fieldExists = True
+        return
+    elif data.startScreenOn == False and event.keysym == 'l':
+        #field lines instead of the arrow grid
+        sim.showFieldLines = not sim.showFieldLines
+        return
+    elif data.startScreenOn == False and event.keysym == 'k':
+        #keep a snapshot of the scene in memory; 'r' goes back to it
+        data.savedScene = sim.toBytes()
+        return
+    elif (data.startScreenOn == False and event.keysym == 'r' and
+          data.savedScene is not None):
+        data.sim = Simulation.fromBytes(data.savedScene)
+        data.sim.profiler.enabled = data.showHud
+        return
+    elif data.startScreenOn == False and event.keysym == 'g':
+        #small graphs of each probe's history
+        data.showSparklines = not data.showSparklines
+        return
+    elif data.startScreenOn == False and event.keysym == 'h':
+        #profiling overlay; the profiler only records while it is shown
+        data.showHud = not data.showHud
+        sim.profiler.enabled = data.showHud
         return
     else:
-        data.finishedDrawingAllPaths = True
+        sim.finishedDrawingAllPaths = True
     
-    if not data.pathMode and not data.motionMode:
-        data.equipCoord = data.voltmeter.pulse(data)
+    if not sim.pathMode and not sim.motionMode:
+        sim.findEquipotential()
     
+def checkFunctionText(textBox):
+    #a box whose expression does not compile turns pink
+    try:
+        expressions.compileExpression(textBox.text)
+        textBox.color = 'white'
+    except ValueError:
+        textBox.color = 'pink'
+
 def timerFired(data):
-    if data.pathMode:
-        pathModeTimerFired(data)
-    
-    if len(data.particles[0])>0 or len(data.particles[1])>0:
-        data.fieldExists = True
-        for fieldList in data.fields:
-            for field in fieldList:
-                    field.point(data.particles, data)
-    else:
-        data.fieldExists = False
-        
-    if len(data.sensors)>0:
-        for sensor in data.sensors:
-            sensor.netF = sensor.calcNetField(data.particles, data)
-    
-    deleteParticlesAndSensors(data)
-    
-    data.voltmeter.calcNetVolt(data)   
-    
-    if data.motionMode:
-        motionModeTimerFired(data)
-    
-    if data.functionMode:
-        functionModeTimerFired(data)
-        
-def deleteParticlesAndSensors(data):
-    for particleList in data.particles:
-        i = 0
-        while i < len(particleList):
-            if (data.trash[0] <= particleList[i].x <= data.trash[2] and
-                data.trash[1] <= particleList[i].y <= data.trash[3] and
-                particleList[i].isClicked==False):
-                del particleList[i]
-            i += 1
-            
-    i = 0
-    while i < len(data.sensors):
-        if (data.trash[0] <= data.sensors[i].x <= data.trash[2] and
-            data.trash[1] <= data.sensors[i].y <= data.trash[3] and
-            data.sensors[i].isClicked==False):
-            del data.sensors[i]
-        i += 1
-    
+    data.sim.setFunctions(data.xText.text, data.yText.text)
+    data.sim.step()
     
 ##########################PATH_MODE_CONTROLLERS############################
 def pathModeMousePressed(event, data):
-    doubleBreak = False
+    sim = data.sim
     #find what particle is clicked
-    if data.drawingPath == False:
-        for particleList in reversed(data.particles):
-            for particle in reversed(particleList):
-                diffX = abs(event.x - particle.x)
-                diffY = abs(event.y - particle.y)
-                
-                if diffX <= particle.r and diffY <= particle.r:
-                    data.particleForPath.append(particle)
-                    data.paths.append(Path(data))
-                    data.drawingPath = True
-                    data.finishedDrawingAllPaths = False
-                    doubleBreak = True
-                    break
-            if doubleBreak:
-                break
+    if sim.drawingPath == False:
+        particle = sim.topmost(sim.objectsAt(event.x, event.y),
+                               [Electron, Proton])
+        if particle is not None:
+            sim.addPath(particle)
+            sim.drawingPath = True
+            sim.finishedDrawingAllPaths = False
     else:
-        data.drawingPath = not data.drawingPath
+        sim.drawingPath = not sim.drawingPath
+        sim.paths[-1].finish()
     
 def pathModeMouseMotion(event, data):
-    if data.drawingPath:
-        data.paths[-1].addToPath(event.x, event.y)
-        
-def pathModeTimerFired(data):
-    if (not data.drawingPath and data.finishedDrawingAllPaths):
-        for i in range(len(data.particleForPath)):
-            data.particleForPath[i].followPath(data.paths[i])
+    if data.sim.drawingPath:
+        data.sim.paths[-1].addToPath(event.x, event.y)
             
 ##########################MOTION_MODE_CONTROLLERS############################
 def motionModeMousePressed(event, data):
     pass
 def motionModeMouseMotion(event, data):
     pass
-def motionModeTimerFired(data):
-    if (len(data.particles[0]) > 1 or len(data.particles[1]) > 1 or 
-        len(data.particles[0]) + len(data.particles[1]) > 1):
-        for particleList in data.particles:
-            for particle in particleList:
-                particle.moveInMotion(data)
                 
 ##########################FUNCTION_MODE_CONTROLLERS############################
 def functionModeMousePressed(event, data):
     pass
 def functionModeMouseMotion(event, data):
     pass
-def functionModeTimerFired(data):
-    for row in range(len(data.fields)-1,-1,-1):
-        for col in range(len(data.fields[0])):
-            data.fields[row][col].matchFunction(row, col, 
-                       int(data.xText.text), int(data.yText.text), 
-                       data)
 
 # This is the VIEW
 # IMPORTANT: VIEW does *not* modify data at all!
@@ -953,7 +1405,7 @@ def redrawAll(canvas, data):
     
     drawPartFieldSens(canvas, data)
     
-    data.voltmeter.draw(canvas)
+    data.sim.voltmeter.draw(canvas)
     
     drawTrash(canvas, data)
     
@@ -964,6 +1416,9 @@ def redrawAll(canvas, data):
     drawPathAndEquip(canvas, data)
     
     drawModeTitles(canvas, data)
+
+    if data.showHud:
+        drawHud(canvas, data)
     
 def drawStartScreen(canvas, data):
     data.startScreen.draw(canvas, data)
@@ -986,22 +1441,47 @@ def drawInstructionScreen(canvas, data):
                            font = ("Courier", 20))
 
 def drawPartFieldSens(canvas, data):
-    for particleList in data.particles:
+    sim = data.sim
+    for particleList in sim.particles:
         for particle in particleList:
             particle.draw(canvas)
 
-    if data.fieldExists or data.functionMode:
-        for row in range(len(data.fields)):
-            for col in range(len(data.fields[row])):
-                data.fields[row][col].draw(canvas)
+    #field lines replace the arrows while they are on
+    if sim.functionMode or (sim.fieldExists and not sim.showFieldLines):
+        for field in sim.activeFields():
+            field.draw(canvas)
     
-    for sensor in data.sensors:
+    for sensor in sim.sensors:
         sensor.draw(canvas)
+        if data.showSparklines:
+            drawSparkline(canvas, sensor.history, sensor.x - 30,
+                          sensor.y + sensor.r + 14, 60, 16)
+    if data.showSparklines:
+        voltmeter = sim.voltmeter
+        drawSparkline(canvas, voltmeter.history,
+                      voltmeter.mainx - voltmeter.rx,
+                      voltmeter.mainy + voltmeter.ry + 5, 2*voltmeter.rx, 20)
+
+def drawSparkline(canvas, history, left, top, width, height):
+    #one line going up and down through each column's min and max
+    line = history.sparkline(int(width/2))
+    if len(line) < 2:
+        return
+    low = min([entry[0] for entry in line])
+    high = max([entry[1] for entry in line])
+    scale = 0 if high == low else height / (high - low)
+    coords = []
+    for i in range(len(line)):
+        x = left + width * i / (len(line) - 1)
+        coords.append((x, top + height - (line[i][1] - low) * scale))
+        coords.append((x, top + height - (line[i][0] - low) * scale))
+    canvas.create_line(coords, fill = 'green')
 
 def drawTrash(canvas, data):
-    canvas.create_rectangle(data.trash, fill = 'green')
-    canvas.create_text((data.trash[2]+data.trash[0])/2,
-                       (data.trash[3]+data.trash[1])/2, 
+    trash = data.sim.trash
+    canvas.create_rectangle(trash, fill = 'green')
+    canvas.create_text((trash[2]+trash[0])/2,
+                       (trash[3]+trash[1])/2,
                        text = ('''Nuclear 
 Waste Disposal'''), fill = 'red4')
     
@@ -1028,67 +1508,115 @@ def drawTextBoxes(canvas, data):
                            font = ("Courier", 25))
     
 def drawPathAndEquip(canvas, data):
-    if len(data.equipCoord) > 1:
-        for coord in data.equipCoord:
-            canvas.create_text(coord, text = 'e', fill = 'orange')
+    if data.sim.showFieldLines and not data.sim.functionMode:
+        for line in data.sim.fieldLines:
+            canvas.create_line(line, fill = 'white', width = 1,
+                               arrow = 'last')
+    for line in data.sim.equipLines:
+        canvas.create_line(line, fill = 'orange', width = 2)
             
-    for path in data.paths:
+    for path in data.sim.paths:
         path.draw(canvas)
     
         
 def drawModeTitles(canvas, data):
-    if data.pathMode:
+    if data.sim.pathMode:
         canvas.create_text(data.width/2, data.height/20, text = 'Path Mode',
                            fill = 'green')
         
-    elif data.motionMode:
+    elif data.sim.motionMode:
         canvas.create_text(data.width/2, data.height/20, text = 'Motion Mode',
                            fill = 'green')
         
-    elif data.functionMode:
+    elif data.sim.functionMode:
         canvas.create_text(data.width/2, data.height/20, text = 'Function Mode',
                            fill = 'green')
+
+def drawHud(canvas, data):
+    lines = data.sim.profiler.hudLines()
+    canvas.create_text(10, 10, text = '\n'.join(lines), anchor = 'nw',
+                       fill = 'yellow', font = ('Courier', 12))
 ####################################
 ####################################
 # use the run function as-is
 ####################################
 ####################################
 
-def run(width=300, height=300):
+def run(width=300, height=300, frameRate=60, tickRate=120):
+    # Tk is only needed for the window; the model above runs without it
+    import time
+    from tkinter import Tk, Canvas
+    from retainedcanvas import RetainedCanvas
+    from scheduler import FrameScheduler
+
     def redrawAllWrapper(canvas, data):
-        canvas.delete(ALL)
-        redrawAll(canvas, data)
+        # items are kept between frames; only changed ones are sent to Tk
+        data.scene.beginFrame()
+        redrawAll(data.scene, data)
+        data.scene.endFrame()
         canvas.update()    
 
     def mousePressedWrapper(event, canvas, data):
+        sim = data.sim
         mousePressed(event, data)
-        redrawAllWrapper(canvas, data)
+        if data.sim is not sim: #Restart
+            useTickRate(data)
+        wakeWrapper(canvas, data)
     
     def mouseMotionWrapper(event, canvas, data):
         mouseMotion(event, data)
-        redrawAllWrapper(canvas, data)
+        wakeWrapper(canvas, data)
 
     def keyPressedWrapper(event, canvas, data):
+        sim = data.sim
         keyPressed(event, data)
-        redrawAllWrapper(canvas, data)
+        if data.sim is not sim: #a restored snapshot
+            useTickRate(data)
+        wakeWrapper(canvas, data)
+
+    def useTickRate(data):
+        # path playback moves by one scheduler tick per step
+        data.sim.tickTime = data.scheduler.tickInterval
+
+    def wakeWrapper(canvas, data):
+        # events only ask for a frame; several events share one redraw
+        if data.scheduler.wake():
+            canvas.after(0, timerFiredWrapper, canvas, data)
 
     def timerFiredWrapper(canvas, data):
-        timerFired(data)
-        redrawAllWrapper(canvas, data)
-        # pause, then call timerFired again
-        canvas.after(data.timerDelay, timerFiredWrapper, canvas, data)
+        # fixed-rate physics ticks, then a render if the budget allows
+        frameStart = time.perf_counter()
+        profiler = data.sim.profiler
+        profiler.beginFrame()
+        for i in range(data.scheduler.ticksDue(frameStart)):
+            timerFired(data)
+        if data.scheduler.shouldRender(frameStart, time.perf_counter()):
+            with profiler.phase('redraw'):
+                redrawAllWrapper(canvas, data)
+            profiler.count('canvasItems', data.scene.itemCount())
+            profiler.count('canvasCreated', data.scene.created)
+            profiler.count('canvasUpdated', data.scene.updated)
+        profiler.endFrame()
+        # stop ticking while nothing moves; the next event restarts it
+        if data.sim.isIdle() and not data.scheduler.dirty:
+            data.scheduler.sleep()
+            return
+        canvas.after(data.scheduler.delay(frameStart, time.perf_counter()),
+                     timerFiredWrapper, canvas, data)
         
     # Set up data and call init
     class Struct(object): pass
     data = Struct()
     data.width = width
     data.height = height
-    data.timerDelay = 1 # milliseconds
+    data.scheduler = FrameScheduler(frameRate, tickRate)
     init(data)
+    useTickRate(data)
     # create the root and the canvas
     root = Tk()
     canvas = Canvas(root, width=data.width, height=data.height)
     canvas.pack()
+    data.scene = RetainedCanvas(canvas)
     # set up events
     root.bind("<Button-1>", lambda event:
                             mousePressedWrapper(event, canvas, data))
@@ -1096,13 +1624,14 @@ def run(width=300, height=300):
                             keyPressedWrapper(event, canvas, data))
     root.bind('<Motion>', lambda event:
                             mouseMotionWrapper(event, canvas, data))
-    timerFiredWrapper(canvas, data)
+    wakeWrapper(canvas, data)
     # and launch the app
 
     root.mainloop()  # blocks until window is closed
     print("bye!")
 
-run(1000, 800)
+if __name__ == '__main__':
+    run(1000, 800)
 
 ###ignore_rest###
 #TEST FUNCTION
@@ -1115,4 +1644,5 @@ def testDistance():
     assert(distance((0,0),(8,15)) == 17)
     print('Worked')
     
-testDistance()
+if __name__ == '__main__':
+    testDistance()
@@ -0,0 +1,76 @@
+# polyline.py
+# Helpers for recorded mouse paths: Ramer-Douglas-Peucker simplification
+# (drops the samples that lie within `tolerance` pixels of the line through
+# their neighbours), cumulative arc length, and a cursor that walks a
+# polyline by distance. Coordinates are kept in array('d') columns.
+
+import math
+from array import array
+
+def simplify(xs, ys, tolerance=1.0):
+    #indices of the points to keep; the first and last are always kept
+    n = len(xs)
+    if n < 3:
+        return list(range(n))
+    keep = [False] * n
+    keep[0] = keep[n-1] = True
+    stack = [(0, n-1)]
+    while len(stack) > 0:
+        (first, last) = stack.pop()
+        (x0, y0, x1, y1) = (xs[first], ys[first], xs[last], ys[last])
+        dx, dy = x1 - x0, y1 - y0
+        length = math.sqrt(dx**2 + dy**2)
+        worst, worstDist = None, tolerance
+        for i in range(first+1, last):
+            if length == 0:
+                dist = math.sqrt((xs[i] - x0)**2 + (ys[i] - y0)**2)
+            else:
+                dist = abs(dy*(xs[i] - x0) - dx*(ys[i] - y0)) / length
+            if dist > worstDist:
+                worst, worstDist = i, dist
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [i for i in range(n) if keep[i]]
+
+def arcLengths(xs, ys):
+    #lengths[i] is the distance along the polyline from point 0 to point i
+    lengths = array('d', [0])
+    for i in range(1, len(xs)):
+        step = math.sqrt((xs[i] - xs[i-1])**2 + (ys[i] - ys[i-1])**2)
+        lengths.append(lengths[-1] + step)
+    return lengths
+
+class Cursor(object):
+    #position at a distance along a polyline; distances only grow, so the
+    #current segment is found by walking forward from the last one
+    def __init__(self, xs, ys, lengths):
+        self.xs, self.ys, self.lengths = xs, ys, lengths
+        self.segment = 0
+        self.distance = 0
+
+    def total(self):
+        return self.lengths[-1] if len(self.lengths) > 0 else 0
+
+    def atEnd(self):
+        return self.distance >= self.total()
+
+    def advance(self, distance):
+        self.distance = min(self.total(), self.distance + distance)
+        return self.point()
+
+    def point(self):
+        (xs, ys, lengths) = (self.xs, self.ys, self.lengths)
+        if len(xs) == 0:
+            return None
+        while (self.segment < len(xs) - 2 and
+               lengths[self.segment+1] < self.distance):
+            self.segment += 1
+        i = self.segment
+        if i + 1 >= len(xs):
+            return (xs[i], ys[i])
+        span = lengths[i+1] - lengths[i]
+        t = 0 if span == 0 else (self.distance - lengths[i]) / span
+        t = min(1, max(0, t))
+        return (xs[i] + t*(xs[i+1] - xs[i]), ys[i] + t*(ys[i+1] - ys[i]))
@@ -0,0 +1,105 @@
+# potentialgrid.py
+# Cached raster of the electric potential over the canvas. It is rebuilt in
+# batch only when the charges change; in between, any probe reads it with
+# a bilinear lookup that costs the same no matter how many charges there are.
+# Readings inside a cell next to a charge are smoothed out by the lookup.
+
+import math
+import kernels
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+K = kernels.K
+
+class PotentialRaster(object):
+    def __init__(self, width, height, cellSize=10):
+        self.width = width
+        self.height = height
+        self.setCellSize(cellSize)
+
+    def setCellSize(self, cellSize):
+        self.cellSize = cellSize
+        self.cols = int(math.ceil(self.width / cellSize)) + 1
+        self.rows = int(math.ceil(self.height / cellSize)) + 1
+        self.invalidate()
+
+    def invalidate(self):
+        self.signature = None
+        self.values = None
+
+    def isValid(self):
+        return self.values is not None
+
+    def matches(self, charges):
+        return self.values is not None and tuple(charges) == self.signature
+
+    def update(self, charges, meter, k=K, useNumpy=True):
+        #charges is a list of (x, y, charge); only recomputes when it changed.
+        #If only a few charges moved (a drag), just their old contributions
+        #are taken out and the new ones added.
+        signature = tuple(charges)
+        if signature == self.signature and self.values is not None:
+            return False
+        useNumpy = useNumpy and np is not None
+        old = self.signature
+        if (self.values is not None and len(old) == len(signature) and
+            isinstance(self.values, list) != useNumpy):
+            changed = [i for i in range(len(signature))
+                       if signature[i] != old[i]]
+            if len(changed) <= len(signature) // 4:
+                self.add([old[i] for i in changed], meter, k, -1)
+                self.add([signature[i] for i in changed], meter, k, 1)
+                self.signature = signature
+                return True
+        if useNumpy:
+            self.values = np.zeros(self.rows * self.cols)
+        else:
+            self.values = [0.0] * (self.rows * self.cols)
+        self.add(signature, meter, k, 1)
+        self.signature = signature
+        return True
+
+    def add(self, charges, meter, k, sign):
+        if isinstance(self.values, list):
+            self.pythonAdd(charges, meter, k * sign)
+        else:
+            self.numpyAdd(charges, meter, k * sign)
+
+    def pythonAdd(self, charges, meter, k):
+        cell, cols, values = self.cellSize, self.cols, self.values
+        for row in range(self.rows):
+            base = row * cols
+            for col in range(cols):
+                values[base + col] += kernels.potentialAt(col*cell, row*cell,
+                                                          charges, meter, k)
+
+    def numpyAdd(self, charges, meter, k):
+        xs = np.arange(self.cols) * float(self.cellSize)
+        ys = np.arange(self.rows) * float(self.cellSize)
+        gx, gy = np.meshgrid(xs, ys)
+        gx, gy = gx.ravel(), gy.ravel()
+        for (cx, cy, q) in charges:
+            d = np.hypot(gx - cx, gy - cy)
+            on = (d == 0)
+            d[on] = 1
+            contribution = k * q * meter / d
+            contribution[on] = 0
+            self.values += contribution
+
+    def sample(self, x, y):
+        #bilinear interpolation between the four surrounding nodes
+        if self.values is None:
+            return 0
+        gx = min(max(x / self.cellSize, 0), self.cols - 1)
+        gy = min(max(y / self.cellSize, 0), self.rows - 1)
+        col = min(int(gx), self.cols - 2)
+        row = min(int(gy), self.rows - 2)
+        fx, fy = gx - col, gy - row
+        i = row * self.cols + col
+        values, cols = self.values, self.cols
+        top = values[i] * (1 - fx) + values[i + 1] * fx
+        bottom = values[i + cols] * (1 - fx) + values[i + cols + 1] * fx
+        return top * (1 - fy) + bottom * fy
@@ -0,0 +1,130 @@
+# profiler.py
+# Per-frame instrumentation: wall time of each phase of a tick, pair
+# interaction counts and canvas item counts, kept for the last `capacity`
+# frames in a ring buffer. Can be shown as a HUD or exported to JSON/CSV.
+# When disabled every call is a cheap no-op.
+
+import collections
+import csv
+import json
+import time
+
+class NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class Phase(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.addTime(self.name, time.perf_counter() - self.start)
+        return False
+
+class FrameProfiler(object):
+    nullPhase = NullPhase()
+
+    def __init__(self, capacity=600, enabled=False):
+        self.frames = collections.deque(maxlen=capacity)
+        self.enabled = enabled
+        self.current = None
+
+    def beginFrame(self):
+        #returns True if this call opened the frame (a step() outside the
+        #GUI opens and closes its own)
+        if not self.enabled or self.current is not None:
+            return False
+        self.current = {'start': time.perf_counter(), 'phases': {},
+                        'counts': {}}
+        return True
+
+    def endFrame(self):
+        if self.current is None:
+            return
+        frame = self.current
+        frame['total'] = time.perf_counter() - frame['start']
+        self.frames.append(frame)
+        self.current = None
+
+    def phase(self, name):
+        #with profiler.phase('fields'): ...
+        if self.current is None:
+            return self.nullPhase
+        return Phase(self, name)
+
+    def addTime(self, name, seconds):
+        if self.current is not None:
+            phases = self.current['phases']
+            phases[name] = phases.get(name, 0) + seconds
+
+    def count(self, name, n):
+        if self.current is not None:
+            counts = self.current['counts']
+            counts[name] = counts.get(name, 0) + n
+
+    def counts(self):
+        #the open frame's counters, for code that tallies on its own
+        if self.current is None:
+            return None
+        return self.current['counts']
+
+    ##########################REPORTS############################
+    def names(self):
+        phases, counts = [], []
+        for frame in self.frames:
+            for name in frame['phases']:
+                if name not in phases:
+                    phases.append(name)
+            for name in frame['counts']:
+                if name not in counts:
+                    counts.append(name)
+        return (phases, counts)
+
+    def averages(self, lastFrames=60):
+        #mean seconds per phase and mean counts over the most recent frames
+        frames = list(self.frames)[-lastFrames:]
+        phases, counts = {}, {}
+        for frame in frames:
+            for name, value in frame['phases'].items():
+                phases[name] = phases.get(name, 0) + value / len(frames)
+            for name, value in frame['counts'].items():
+                counts[name] = counts.get(name, 0) + value / len(frames)
+        total = sum([frame['total'] for frame in frames])
+        return {'frames': len(frames), 'phases': phases, 'counts': counts,
+                'total': total / max(1, len(frames))}
+
+    def hudLines(self, lastFrames=60):
+        report = self.averages(lastFrames)
+        lines = ['frame %.2f ms' % (report['total']*1000)]
+        for name, value in sorted(report['phases'].items(),
+                                  key=lambda item: -item[1]):
+            lines.append('%s %.2f ms' % (name, value*1000))
+        for name, value in sorted(report['counts'].items()):
+            lines.append('%s %d' % (name, value))
+        return lines
+
+    def exportJSON(self, path):
+        with open(path, 'w') as f:
+            json.dump(list(self.frames), f, indent=1)
+
+    def exportCSV(self, path):
+        #one row per frame; phase times in milliseconds
+        (phases, counts) = self.names()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'total_ms'] +
+                            [name + '_ms' for name in phases] + counts)
+            for i, frame in enumerate(self.frames):
+                writer.writerow([i, frame['total']*1000] +
+                                [frame['phases'].get(name, 0)*1000
+                                 for name in phases] +
+                                [frame['counts'].get(name, 0)
+                                 for name in counts])
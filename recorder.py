@@ -0,0 +1,152 @@
+# recorder.py
+# Records particle positions every step to a columnar file and plays them
+# back without running the physics. Layout (little endian, all doubles
+# 8-byte aligned):
+#
+#     header  magic b'PLTR', version (uint16), 2 pad bytes, canvas width
+#             and height (doubles)
+#     chunk   b'CHNK', frames F and particles N (uint32), 4 pad bytes, then
+#             the N charges, the F times, F*N x and F*N y (frame after frame)
+#
+# Frames are buffered in memory and written a chunk at a time. A new chunk
+# starts when it is full or when the set of particles changes, so each chunk
+# has one fixed record layout. The replay memory-maps the file, indexes the
+# chunk headers and copies out only the frame asked for, so a long run is
+# never loaded whole.
+
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'PLTR'
+CHUNK_MAGIC = b'CHNK'
+VERSION = 1
+HEADER = struct.Struct('<4sH2xdd')
+CHUNK_HEADER = struct.Struct('<4sII4x')
+
+def littleEndian(column):
+    if sys.byteorder == 'big':
+        column = array('d', column)
+        column.byteswap()
+    return column
+
+class TrajectoryRecorder(object):
+    def __init__(self, path, width, height, framesPerChunk=256,
+                 bufferSize=2**20):
+        self.file = open(path, 'wb', buffering=bufferSize)
+        self.file.write(HEADER.pack(MAGIC, VERSION, width, height))
+        self.framesPerChunk = framesPerChunk
+        self.charges = None
+        self.times, self.xs, self.ys = array('d'), array('d'), array('d')
+        self.frames = 0 #written and buffered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def record(self, store, time):
+        #one frame: the current columns of a ParticleStore
+        if self.charges != store.charge:
+            self.flush()
+            self.charges = array('d', store.charge)
+        self.times.append(time)
+        self.xs.extend(store.x)
+        self.ys.extend(store.y)
+        self.frames += 1
+        if len(self.times) >= self.framesPerChunk:
+            self.flush()
+
+    def flush(self):
+        #write the buffered frames as one chunk
+        if len(self.times) == 0:
+            return
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(self.times),
+                                          len(self.charges)))
+        for column in (self.charges, self.times, self.xs, self.ys):
+            self.file.write(littleEndian(column).tobytes())
+        self.times, self.xs, self.ys = array('d'), array('d'), array('d')
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+class TrajectoryReplay(object):
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.width, self.height) = HEADER.unpack_from(
+                                                        self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('not a trajectory recording')
+        if version > VERSION:
+            raise ValueError('recording version %d is newer than %d' %
+                             (version, VERSION))
+        #(first frame, frames, particles, offset of the charges) per chunk;
+        #only the chunk headers are read
+        self.chunks = []
+        self.frameCount = 0
+        offset = HEADER.size
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            (magic, frames, particles) = CHUNK_HEADER.unpack_from(self.map,
+                                                                  offset)
+            end = (offset + CHUNK_HEADER.size +
+                   8 * (particles + frames + 2*frames*particles))
+            if magic != CHUNK_MAGIC or end > len(self.map):
+                break #a recording that was cut off
+            self.chunks.append((self.frameCount, frames, particles,
+                                offset + CHUNK_HEADER.size))
+            self.frameCount += frames
+            offset = end
+
+    def __len__(self):
+        return self.frameCount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def doubles(self, offset, count):
+        #copies just these count values out of the map
+        column = array('d')
+        column.frombytes(self.map[offset:offset + 8*count])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        return column
+
+    def findChunk(self, index):
+        #binary search over the chunk start frames
+        lo, hi = 0, len(self.chunks) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.chunks[mid][0] <= index:
+                lo = mid
+            else:
+                hi = mid - 1
+        return self.chunks[lo]
+
+    def frame(self, index):
+        #(time, charges, xs, ys) of frame index as array('d') columns
+        if not 0 <= index < self.frameCount:
+            raise IndexError('frame %d of %d' % (index, self.frameCount))
+        (first, frames, particles, offset) = self.findChunk(index)
+        i = index - first
+        charges = self.doubles(offset, particles)
+        offset += 8 * particles
+        time = self.doubles(offset + 8*i, 1)[0]
+        offset += 8 * frames
+        xs = self.doubles(offset + 8*i*particles, particles)
+        offset += 8 * frames * particles
+        ys = self.doubles(offset + 8*i*particles, particles)
+        return (time, charges, xs, ys)
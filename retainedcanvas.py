@@ -0,0 +1,116 @@
+# retainedcanvas.py
+# Retained-mode stand-in for the Tk canvas. The view still calls
+# canvas.create_oval/create_text/... every frame, but the n-th create call of
+# a frame reuses the item made by the n-th call of the previous frame and only
+# sends canvas.coords/itemconfig when its coordinates or options changed.
+# An item is only reused by a call of the same kind with the same option
+# names; otherwise it is replaced, so no option outlives the call that set it.
+# Leftover items are hidden, not deleted, so they can be reused later.
+
+class CanvasItem(object):
+    __slots__ = ('kind', 'id', 'coords', 'options', 'hidden')
+
+    def __init__(self, kind, id, coords, options):
+        self.kind = kind
+        self.id = id
+        self.coords = coords
+        self.options = options
+        self.hidden = False
+
+class RetainedCanvas(object):
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = []
+        self.count = 0
+        self.restack = False
+        #per-frame counts of Tk calls, for profiling
+        self.created = 0
+        self.updated = 0
+
+    def __getattr__(self, name):
+        #create_* goes through the item cache; everything else is the canvas
+        if name.startswith('create_'):
+            kind = name[len('create_'):]
+            return lambda *args, **options: self.create(kind, args, options)
+        return getattr(self.canvas, name)
+
+    def beginFrame(self):
+        self.count = 0
+        self.restack = False
+        self.created = 0
+        self.updated = 0
+
+    def create(self, kind, args, options):
+        coords = flatten(args)
+        if self.count < len(self.items):
+            item = self.items[self.count]
+            #an option left out of the call would keep its value from the
+            #item's last use, so only an item set up with the same option
+            #names is reused
+            if item.kind == kind and item.options.keys() == options.keys():
+                self.update(item, coords, options)
+            else:
+                self.canvas.delete(item.id)
+                item = self.make(kind, coords, options)
+                self.items[self.count] = item
+        else:
+            item = self.make(kind, coords, options)
+            self.items.append(item)
+        self.count += 1
+        return item.id
+
+    def make(self, kind, coords, options):
+        create = getattr(self.canvas, 'create_' + kind)
+        self.created += 1
+        if self.count < len(self.items):
+            #a new item lands on top of everything, out of draw order
+            self.restack = True
+        return CanvasItem(kind, create(coords, **options), coords,
+                          dict(options))
+
+    def update(self, item, coords, options):
+        changed = False
+        if coords != item.coords:
+            self.canvas.coords(item.id, *coords)
+            item.coords = coords
+            changed = True
+        newOptions = {}
+        for key in options:
+            if item.options.get(key) != options[key]:
+                newOptions[key] = options[key]
+        item.options.update(newOptions)
+        if item.hidden:
+            newOptions['state'] = 'normal'
+            item.hidden = False
+        if len(newOptions) > 0:
+            self.canvas.itemconfig(item.id, **newOptions)
+            changed = True
+        if changed:
+            self.updated += 1
+
+    def endFrame(self):
+        for item in self.items[self.count:]:
+            if not item.hidden:
+                self.canvas.itemconfig(item.id, state='hidden')
+                item.hidden = True
+        if self.restack:
+            for item in self.items[:self.count]:
+                self.canvas.tag_raise(item.id)
+
+    def itemCount(self):
+        #items drawn this frame
+        return self.count
+
+    def clear(self):
+        for item in self.items:
+            self.canvas.delete(item.id)
+        self.items = []
+
+def flatten(args):
+    coords = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            coords.extend(flatten(arg))
+        else:
+            coords.append(arg)
+    return coords
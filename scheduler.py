@@ -0,0 +1,84 @@
+# scheduler.py
+# Decides when the GUI runs physics ticks and when it redraws. Ticks run at a
+# fixed rate from a time accumulator; frames are rendered at most frameRate
+# times a second. If the ticks of a frame use up the frame budget the render
+# is dropped (never the ticks), and when the simulation is idle the loop
+# stops until an event wakes it again. Times are in seconds.
+
+import time
+
+class FrameScheduler(object):
+    def __init__(self, frameRate=60, tickRate=120, maxTicksPerFrame=8,
+                 clock=time.perf_counter):
+        self.frameInterval = 1/frameRate
+        self.tickInterval = 1/tickRate
+        #more ticks than this in one frame means we cannot keep up; the
+        #extra time is dropped instead of piling up
+        self.maxTicksPerFrame = maxTicksPerFrame
+        self.budget = self.frameInterval
+        #never drop more than this many renders in a row
+        self.maxDroppedInARow = 5
+        self.clock = clock
+
+        self.lastTime = None
+        self.backlog = 0
+        self.droppedInARow = 0
+        self.dirty = True #something changed since the last render
+        self.woken = False #an event asked for at least one tick
+        self.running = False #a frame is scheduled
+
+        #totals, for profiling
+        self.ticks = 0
+        self.renders = 0
+        self.droppedRenders = 0
+
+    def ticksDue(self, now):
+        if self.lastTime is None:
+            self.lastTime = now
+        self.backlog += now - self.lastTime
+        self.lastTime = now
+        ticks = int(self.backlog / self.tickInterval)
+        self.backlog -= ticks * self.tickInterval
+        if ticks > self.maxTicksPerFrame:
+            ticks = self.maxTicksPerFrame
+            self.backlog = 0
+        if self.woken:
+            ticks = max(ticks, 1)
+            self.woken = False
+        self.ticks += ticks
+        if ticks > 0:
+            self.dirty = True
+        return ticks
+
+    def shouldRender(self, frameStart, now):
+        if not self.dirty:
+            return False
+        if (now - frameStart > self.budget and
+            self.droppedInARow < self.maxDroppedInARow):
+            self.droppedInARow += 1
+            self.droppedRenders += 1
+            return False
+        self.droppedInARow = 0
+        self.renders += 1
+        self.dirty = False
+        return True
+
+    def delay(self, frameStart, now):
+        #milliseconds until the next frame should start
+        remaining = self.frameInterval - (now - frameStart)
+        return max(1, int(remaining * 1000))
+
+    def wake(self):
+        #returns True if the caller has to schedule a frame
+        self.dirty = True
+        self.woken = True
+        if self.running:
+            return False
+        self.running = True
+        return True
+
+    def sleep(self):
+        #stop until the next wake; idle time is not simulated
+        self.running = False
+        self.lastTime = None
+        self.backlog = 0
@@ -0,0 +1,173 @@
+# snapshot.py
+# Whole-scene snapshots: charges (every store column), sensors, voltmeter,
+# paths and playback positions, modes and settings. The binary layout is
+#
+#     header    magic b'PLAB', format version (uint16), metadata length
+#               (uint32), little endian
+#     metadata  UTF-8 JSON with the counts and the scalar settings
+#     arrays    packed little-endian doubles, one column after another
+#               (x, y, vx, vy, charge, mass, radius for the protons then the
+#               electrons, their flag bytes, sensor x and y, path x and y)
+#
+# so saving and loading are a handful of array copies. toBytes/fromBytes
+# keep snapshots in memory; save/load use a file. Loading is handed the
+# Simulation class (Simulation.fromBytes does that), so this module never
+# imports physicslab: run as a script, that would be a second copy of it
+# whose particles the GUI would not recognize.
+
+import json
+import struct
+import sys
+from array import array
+
+import particlestore
+import polyline
+
+MAGIC = b'PLAB'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+
+SETTINGS = ['batchFields', 'forceEngine', 'theta', 'directBelow', 'time',
+            'useRaster', 'showFieldLines', 'tickTime', 'pathMode',
+            'drawingPath', 'finishedDrawingAllPaths', 'motionMode',
+            'functionMode', 'logProbes', 'fieldSolver', 'meshAbove']
+
+def packDoubles(values):
+    column = array('d', values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+def unpackDoubles(blob, offset, count):
+    column = array('d')
+    column.frombytes(blob[offset:offset + 8*count])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return (column, offset + 8*count)
+
+def toBytes(sim):
+    particles = sim.allParticles()
+    meta = {'width': sim.width, 'height': sim.height,
+            'gridSize': sim.gridSize, 'adaptiveGrid': sim.adaptiveGrid,
+            'protons': len(sim.protons), 'electrons': len(sim.electrons),
+            'sensors': len(sim.sensors),
+            'voltmeter': [sim.voltmeter.x, sim.voltmeter.y],
+            'xFunc': sim.xFunc, 'yFunc': sim.yFunc, 'integrator': None,
+            'paths': []}
+    for name in SETTINGS:
+        meta[name] = getattr(sim, name)
+    if sim.integrator is not None:
+        meta['integrator'] = [sim.integrator.dt, sim.integrator.substeps]
+    #particles are referred to by their place in protons + electrons
+    places = {}
+    for i in range(len(particles)):
+        places[particles[i]] = i
+    pathXs, pathYs = array('d'), array('d')
+    for i in range(len(sim.paths)):
+        path = sim.paths[i]
+        record = {'particle': places.get(sim.particleForPath[i]),
+                  'points': len(path.xs), 'speed': path.speed,
+                  'tolerance': path.tolerance, 'started': path.started,
+                  'finished': path.cursor is not None, 'distance': 0}
+        if path.cursor is not None:
+            record['distance'] = path.cursor.distance
+        meta['paths'].append(record)
+        pathXs.extend(path.xs)
+        pathYs.extend(path.ys)
+
+    metaBytes = json.dumps(meta).encode('utf-8')
+    parts = [HEADER.pack(MAGIC, VERSION, len(metaBytes)), metaBytes]
+    for name in particlestore.COLUMNS:
+        parts.append(packDoubles([getattr(particle.store,
+                                          name)[particle.index]
+                                  for particle in particles]))
+    parts.append(bytes([particle.store.flags[particle.index]
+                        for particle in particles]))
+    parts.append(packDoubles([sensor.x for sensor in sim.sensors]))
+    parts.append(packDoubles([sensor.y for sensor in sim.sensors]))
+    parts.append(packDoubles(pathXs))
+    parts.append(packDoubles(pathYs))
+    return b''.join(parts)
+
+def fromBytes(blob, simulation):
+    #a new simulation (made by calling the Simulation class given) in the
+    #saved state; ValueError if blob is not a snapshot this version can read
+    if len(blob) < HEADER.size:
+        raise ValueError('not a scene snapshot')
+    (magic, version, metaLength) = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError('not a scene snapshot')
+    if version > VERSION:
+        raise ValueError('snapshot version %d is newer than %d' %
+                         (version, VERSION))
+    offset = HEADER.size
+    meta = json.loads(blob[offset:offset + metaLength].decode('utf-8'))
+    offset += metaLength
+
+    sim = simulation(meta['width'], meta['height'], meta['gridSize'],
+                     meta['adaptiveGrid'])
+    count = meta['protons'] + meta['electrons']
+    columns = {}
+    for name in particlestore.COLUMNS:
+        (columns[name], offset) = unpackDoubles(blob, offset, count)
+    flags = blob[offset:offset + count]
+    offset += count
+    for i in range(count):
+        if i < meta['protons']:
+            particle = sim.addProton(columns['x'][i], columns['y'][i])
+        else:
+            particle = sim.addElectron(columns['x'][i], columns['y'][i])
+        for name in particlestore.COLUMNS:
+            getattr(sim.store, name)[particle.index] = columns[name][i]
+        sim.store.flags[particle.index] = flags[i]
+
+    (sensorXs, offset) = unpackDoubles(blob, offset, meta['sensors'])
+    (sensorYs, offset) = unpackDoubles(blob, offset, meta['sensors'])
+    for i in range(meta['sensors']):
+        sim.addSensor(sensorXs[i], sensorYs[i])
+
+    points = sum([record['points'] for record in meta['paths']])
+    (pathXs, offset) = unpackDoubles(blob, offset, points)
+    (pathYs, offset) = unpackDoubles(blob, offset, points)
+    particles = sim.allParticles()
+    start = 0
+    for record in meta['paths']:
+        end = start + record['points']
+        if record['particle'] is None:
+            #its particle had already been thrown away
+            start = end
+            continue
+        path = sim.addPath(particles[record['particle']])
+        path.speed, path.tolerance = record['speed'], record['tolerance']
+        path.xs, path.ys = pathXs[start:end], pathYs[start:end]
+        path.started = record['started']
+        if record['finished']:
+            #already simplified when it was saved
+            path.cursor = polyline.Cursor(path.xs, path.ys,
+                                          polyline.arcLengths(path.xs,
+                                                              path.ys))
+            path.cursor.distance = record['distance']
+        start = end
+
+    for name in SETTINGS:
+        #snapshots from before a setting existed keep its default
+        if name in meta:
+            setattr(sim, name, meta[name])
+    sim.setFunctions(meta['xFunc'], meta['yFunc'])
+    #move() places the voltmeter's body and screen with the probe and
+    #reads the volts there
+    (x, y) = meta['voltmeter']
+    sim.voltmeter.move(x, y, sim)
+    if meta['integrator'] is None:
+        sim.integrator = None
+    else:
+        (sim.integrator.dt, sim.integrator.substeps) = meta['integrator']
+    return sim
+
+def save(sim, path):
+    with open(path, 'wb') as f:
+        f.write(toBytes(sim))
+
+def load(path, simulation):
+    with open(path, 'rb') as f:
+        return fromBytes(f.read(), simulation)
@@ -0,0 +1,91 @@
+# spatialhash.py
+# Uniform grid for "what is under this point" and "what is inside this
+# rectangle". Objects are bucketed by the cell of their center and need
+# x, y and r attributes; a point query only looks at the cells within the
+# largest radius of the point, so it does not grow with the object count.
+# Whoever moves an object calls update() so its bucket stays right.
+# Every object also keeps the serial number it was inserted with, so callers
+# can tell which of several hits was added last without searching a list.
+
+class SpatialHash(object):
+    def __init__(self, cellSize=40):
+        self.cellSize = cellSize
+        self.cells = {} #(col, row) -> set of objects
+        self.keys = {} #object -> its (col, row)
+        self.serials = {} #object -> insertion number
+        self.inserted = 0
+        self.maxRadius = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, obj):
+        return obj in self.keys
+
+    def cellOf(self, x, y):
+        return (int(x // self.cellSize), int(y // self.cellSize))
+
+    def insert(self, obj):
+        self.serials[obj] = self.inserted
+        self.inserted += 1
+        self.place(obj, self.cellOf(obj.x, obj.y))
+        self.maxRadius = max(self.maxRadius, obj.r)
+
+    def place(self, obj, key):
+        self.cells.setdefault(key, set()).add(obj)
+        self.keys[obj] = key
+
+    def unplace(self, obj, key):
+        bucket = self.cells[key]
+        bucket.discard(obj)
+        if len(bucket) == 0:
+            del self.cells[key]
+
+    def remove(self, obj):
+        key = self.keys.pop(obj, None)
+        if key is None:
+            return
+        del self.serials[obj]
+        self.unplace(obj, key)
+
+    def serial(self, obj):
+        return self.serials[obj]
+
+    def update(self, obj):
+        #cheap when the object stayed in its cell
+        key = self.keys.get(obj)
+        if key is None:
+            return
+        newKey = self.cellOf(obj.x, obj.y)
+        if newKey != key:
+            self.unplace(obj, key)
+            self.place(obj, newKey)
+
+    def candidates(self, left, top, right, bottom):
+        (col0, row0) = self.cellOf(left, top)
+        (col1, row1) = self.cellOf(right, bottom)
+        found = []
+        for col in range(col0, col1+1):
+            for row in range(row0, row1+1):
+                bucket = self.cells.get((col, row))
+                if bucket is not None:
+                    found.extend(bucket)
+        return found
+
+    def queryPoint(self, x, y):
+        #objects whose square of half-width r covers (x, y), the same test
+        #as the click handlers
+        r = self.maxRadius
+        hits = []
+        for obj in self.candidates(x - r, y - r, x + r, y + r):
+            if abs(x - obj.x) <= obj.r and abs(y - obj.y) <= obj.r:
+                hits.append(obj)
+        return hits
+
+    def queryRect(self, left, top, right, bottom):
+        #objects whose center is inside the rectangle (edges included)
+        hits = []
+        for obj in self.candidates(left, top, right, bottom):
+            if left <= obj.x <= right and top <= obj.y <= bottom:
+                hits.append(obj)
+        return hits
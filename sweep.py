@@ -0,0 +1,169 @@
+# sweep.py
+# Runs many motion-mode scenarios without a display, spread over a process
+# pool, and writes one JSON line per scenario to a results file as soon as
+# it finishes:
+#
+#     python sweep.py scenarios.json results.jsonl [--workers 8] [--seed 0]
+#
+# scenarios.json is a list of objects; every key is optional:
+#     name                  label copied to the result
+#     width, height         canvas size in pixels (1000 x 800)
+#     protons, electrons    [[x, y], ...] placed as given
+#     randomProtons,        that many more, placed uniformly over the canvas
+#     randomElectrons       with the scenario's own random generator
+#     protonMass,           kilograms, replacing the default masses
+#     electronMass
+#     dt, substeps          integrator settings (VerletIntegrator defaults)
+#     frames                motion mode frames to run (100)
+#     forceEngine, theta    'direct' or 'barneshut', as on Simulation
+#     seed                  overrides the seed derived from --seed and the
+#                           scenario's position in the list
+#
+# Each result holds the seed, timings, the energy at the start and end and
+# the final state of every particle. A scenario that raises is reported with
+# its traceback instead of stopping the sweep.
+
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import time
+import traceback
+
+import physicslab
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def scenarioSeed(baseSeed, index):
+    #the same on every run and in every process (string seeds are hashed
+    #with sha512, not the per-process hash())
+    return random.Random('%s:%d' % (baseSeed, index)).getrandbits(32)
+
+def initWorker(baseSeed):
+    #scenarios only use their own seeded generator; this just keeps any
+    #other use of the global generators from repeating across workers
+    workerSeed = scenarioSeed(baseSeed, os.getpid())
+    random.seed(workerSeed)
+    if np is not None:
+        np.random.seed(workerSeed)
+
+def buildSimulation(scenario, rng):
+    width = scenario.get('width', 1000)
+    height = scenario.get('height', 800)
+    sim = physicslab.Simulation(width, height)
+    for (x, y) in scenario.get('protons', []):
+        sim.addProton(x, y)
+    for (x, y) in scenario.get('electrons', []):
+        sim.addElectron(x, y)
+    for i in range(scenario.get('randomProtons', 0)):
+        sim.addProton(rng.uniform(0, width), rng.uniform(0, height))
+    for i in range(scenario.get('randomElectrons', 0)):
+        sim.addElectron(rng.uniform(0, width), rng.uniform(0, height))
+    if 'protonMass' in scenario:
+        for proton in sim.protons:
+            proton.mass = scenario['protonMass']
+    if 'electronMass' in scenario:
+        for electron in sim.electrons:
+            electron.mass = scenario['electronMass']
+    sim.integrator.dt = scenario.get('dt', sim.integrator.dt)
+    sim.integrator.substeps = scenario.get('substeps',
+                                           sim.integrator.substeps)
+    sim.forceEngine = scenario.get('forceEngine', sim.forceEngine)
+    sim.theta = scenario.get('theta', sim.theta)
+    sim.motionMode = True
+    return sim
+
+def energyRecord(sim):
+    (kinetic, potential) = sim.energy()
+    return {'kinetic': kinetic, 'potential': potential,
+            'total': kinetic + potential}
+
+def finalState(sim):
+    state = []
+    for particle in sim.allParticles():
+        kind = 'electron'
+        if isinstance(particle, physicslab.Proton):
+            kind = 'proton'
+        state.append([kind, particle.x, particle.y, particle.vx,
+                      particle.vy])
+    return state
+
+def runScenario(index, scenario, seed):
+    #one scenario in a worker; returns its result record
+    result = {'index': index, 'name': scenario.get('name', str(index)),
+              'seed': seed, 'worker': os.getpid()}
+    try:
+        start = time.perf_counter()
+        sim = buildSimulation(scenario, random.Random(seed))
+        result['particles'] = sim.particleCount()
+        result['setupSeconds'] = time.perf_counter() - start
+        result['energyStart'] = energyRecord(sim)
+        frames = scenario.get('frames', 100)
+        start = time.perf_counter()
+        for i in range(frames):
+            sim.stepMotion()
+        result['runSeconds'] = time.perf_counter() - start
+        result['frames'] = frames
+        result['physicalSeconds'] = sim.time
+        result['energyEnd'] = energyRecord(sim)
+        result['energyDrift'] = (result['energyEnd']['total'] -
+                                 result['energyStart']['total'])
+        result['final'] = finalState(sim)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    return result
+
+def runSweep(scenarios, path, workers=None, seed=0, report=print):
+    #workers=0 runs everything in this process (handy for debugging);
+    #results are written in the order they finish and returned by index
+    results = [None] * len(scenarios)
+    seeds = [scenario.get('seed', scenarioSeed(seed, i))
+             for i, scenario in enumerate(scenarios)]
+    with open(path, 'w') as f:
+        def record(result):
+            results[result['index']] = result
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            report(formatResult(result))
+        if workers == 0:
+            for i in range(len(scenarios)):
+                record(runScenario(i, scenarios[i], seeds[i]))
+            return results
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=initWorker,
+                initargs=(seed,)) as pool:
+            futures = [pool.submit(runScenario, i, scenarios[i], seeds[i])
+                       for i in range(len(scenarios))]
+            for future in concurrent.futures.as_completed(futures):
+                record(future.result())
+    return results
+
+def formatResult(result):
+    if 'error' in result:
+        return '%-20s failed: %s' % (result['name'],
+                                     result['error'].strip().split('\n')[-1])
+    return ('%-20s n=%-5d %8.3f s  energy %.4g -> %.4g J' %
+            (result['name'], result['particles'], result['runSeconds'],
+             result['energyStart']['total'], result['energyEnd']['total']))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run motion mode scenarios across a process pool')
+    parser.add_argument('scenarios', help='JSON file with a list of scenarios')
+    parser.add_argument('results', help='JSON lines file to write')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (all cores by default, 0 to '
+                             'run in this process)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base seed for the scenarios')
+    args = parser.parse_args()
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    runSweep(scenarios, args.results, args.workers, args.seed)
+
+if __name__ == '__main__':
+    main()
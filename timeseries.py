@@ -0,0 +1,110 @@
+# timeseries.py
+# Bounded histories for probe readings. A DecimatedSeries keeps the newest
+# `capacity` raw samples, and above them `levels` coarser rings in which
+# every entry summarizes `factor` entries of the ring below (min, max and
+# mean). Memory is fixed at (levels + 1) * capacity entries however long the
+# run is: recent history at full resolution, older history coarser.
+
+import csv
+from array import array
+
+class Ring(object):
+    #fixed-size columns of (time, min, max, mean); the oldest entry is
+    #overwritten once it is full
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0]) * capacity
+        self.mins = array('d', [0]) * capacity
+        self.maxs = array('d', [0]) * capacity
+        self.means = array('d', [0]) * capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, time, low, high, mean):
+        if self.count < self.capacity:
+            i = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[i], self.mins[i] = time, low
+        self.maxs[i], self.means[i] = high, mean
+
+    def entries(self):
+        #oldest first
+        entries = []
+        for j in range(self.count):
+            i = (self.start + j) % self.capacity
+            entries.append((self.times[i], self.mins[i], self.maxs[i],
+                            self.means[i]))
+        return entries
+
+class DecimatedSeries(object):
+    def __init__(self, capacity=256, factor=8, levels=3):
+        self.factor = factor
+        self.rings = [Ring(capacity) for i in range(levels + 1)]
+        #bucket being filled for each coarser level: [count, first time,
+        #min, max, sum]
+        self.pending = [None] * levels
+
+    def add(self, time, value):
+        self.push(0, time, value, value, value)
+
+    def push(self, level, time, low, high, mean):
+        self.rings[level].push(time, low, high, mean)
+        if level + 1 >= len(self.rings):
+            return
+        bucket = self.pending[level]
+        if bucket is None:
+            bucket = self.pending[level] = [0, time, low, high, 0]
+        bucket[0] += 1
+        bucket[2] = min(bucket[2], low)
+        bucket[3] = max(bucket[3], high)
+        bucket[4] += mean
+        if bucket[0] == self.factor:
+            self.pending[level] = None
+            self.push(level + 1, bucket[1], bucket[2], bucket[3],
+                      bucket[4] / self.factor)
+
+    def entries(self, level=0):
+        #(time, min, max, mean) oldest first; time is the bucket's first
+        return self.rings[level].entries()
+
+    def latest(self):
+        ring = self.rings[0]
+        if ring.count == 0:
+            return None
+        return ring.means[(ring.start + ring.count - 1) % ring.capacity]
+
+    def sparkline(self, columns=40):
+        #(min, max) per column over the whole retained history, from the
+        #finest level that still holds all of it
+        level = 0
+        while (level < len(self.rings) - 1 and
+               len(self.rings[level]) == self.rings[level].capacity):
+            level += 1
+        entries = self.entries(level)
+        if len(entries) == 0:
+            return []
+        columns = min(columns, len(entries))
+        line = []
+        for c in range(columns):
+            chunk = entries[c*len(entries)//columns:
+                            (c+1)*len(entries)//columns]
+            line.append((min([entry[1] for entry in chunk]),
+                         max([entry[2] for entry in chunk])))
+        return line
+
+def exportCSV(histories, path):
+    #histories is [(name, DecimatedSeries)]; one row per retained entry of
+    #every level
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['probe', 'level', 'time', 'min', 'max', 'mean'])
+        for (name, series) in histories:
+            for level in range(len(series.rings)):
+                for entry in series.entries(level):
+                    writer.writerow([name, level] + list(entry))